@@ -1,9 +1,14 @@
 from fastmcp import FastMCP
 import sys
+import asyncio
 import logging
-import urllib.request
-import xml.etree.ElementTree as ET
+import os
+import urllib.parse
 import re
+import http_client
+from cache_utils import SingleFlight, TTLCache
+from feed_utils import FeedCache, FeedPrefetcher
+from html_utils import clean_text, extract_headlines, extract_paragraphs
 
 logger = logging.getLogger('VnExpress')
 
@@ -12,8 +17,12 @@ if sys.platform == 'win32':
     sys.stderr.reconfigure(encoding='utf-8')
     sys.stdout.reconfigure(encoding='utf-8')
 
+def feed_lifespan(server):
+    """Chạy background prefetcher RSS (nếu bật RSS_PREFETCH) cùng vòng đời server"""
+    return feed_prefetcher.lifespan(server)
+
 # Create an MCP server
-mcp = FastMCP("VnExpress")
+mcp = FastMCP("VnExpress", lifespan=feed_lifespan)
 
 # RSS Feeds theo chủ đề
 RSS_FEEDS = {
@@ -37,77 +46,51 @@ RSS_FEEDS = {
     "xe": "https://vnexpress.net/rss/oto-xe-may.rss",
 }
 
-_TAG_RE = re.compile(r"<[^>]+>")
+# Cache RSS đã parse, theo URL (TTL + ETag/Last-Modified)
+feed_cache = FeedCache()
+feed_prefetcher = FeedPrefetcher(feed_cache, RSS_FEEDS.values())
 
-def strip_html(text):
-    """Loại bỏ HTML tags và hình ảnh từ text"""
-    if not text:
-        return ""
-    no_tags = _TAG_RE.sub("", text)
-    no_images = re.sub(r"https?://\S+\.(?:png|jpg|jpeg|gif|svg)\S*", "", no_tags, flags=re.IGNORECASE)
-    no_images = re.sub(r"data:image/[^;\s]+;base64,[A-Za-z0-9+/=]+", "", no_images, flags=re.IGNORECASE)
-    return " ".join(no_images.split())
+# Cache nội dung bài viết đã trích xuất, theo URL chuẩn hóa
+# (ARTICLE_CACHE_TTL giây, tối đa ARTICLE_CACHE_SIZE bài)
+article_cache = TTLCache(
+    maxsize=int(os.getenv("ARTICLE_CACHE_SIZE", "128")),
+    ttl=float(os.getenv("ARTICLE_CACHE_TTL", "1800")),
+)
 
-def parse_xml_to_dict(xml_text):
-    """Parse XML thành dictionary"""
-    root = ET.fromstring(xml_text)
+# Số feed được tải song song trong get_vnexpress_news_batch
+BATCH_CONCURRENCY = int(os.getenv("NEWS_BATCH_CONCURRENCY", "4"))
 
-    def elem_to_dict(elem):
-        children = list(elem)
-        if not children:
-            text = elem.text.strip() if elem.text and elem.text.strip() else ""
-            if elem.attrib:
-                data = {"_text": text} if text else {}
-                data.update({f"@{k}": v for k, v in elem.attrib.items()})
-                return data
-            return text
+# Nhiều thiết bị mở cùng một bài cùng lúc chỉ tải trang một lần
+article_flight = SingleFlight()
 
-        result = {}
-        for k, v in elem.attrib.items():
-            result[f"@{k}"] = v
-        for child in children:
-            child_val = elem_to_dict(child)
-            tag = child.tag
-            if tag in result:
-                if not isinstance(result[tag], list):
-                    result[tag] = [result[tag]]
-                result[tag].append(child_val)
-            else:
-                result[tag] = child_val
-        return result
+ARTICLE_MAX_CHARS = 2000
+ARTICLE_MAX_PARAGRAPHS = 20
+_TITLE_RE = re.compile(r'<h1[^>]*class="[^"]*title-detail[^"]*"[^>]*>(.*?)</h1>', re.DOTALL)
+_DESCRIPTION_RE = re.compile(r'<p[^>]*class="[^"]*description[^"]*"[^>]*>(.*?)</p>', re.DOTALL)
+_DATE_RE = re.compile(r'<span[^>]*class="[^"]*date[^"]*"[^>]*>(.*?)</span>', re.DOTALL)
 
-    return {root.tag: elem_to_dict(root)}
 
-def extract_rss_items(parsed):
-    """Trích xuất items từ RSS feed"""
-    items = []
-    if "rss" in parsed:
-        channel = parsed["rss"].get("channel", {})
-        raw_items = channel.get("item", [])
-    elif "feed" in parsed:
-        raw_items = parsed["feed"].get("entry", [])
-    else:
-        raw_items = parsed.get("item", [])
-    
-    if isinstance(raw_items, dict):
-        raw_items = [raw_items]
-    
-    for it in raw_items:
-        simple = {}
-        if isinstance(it, dict):
-            for k, v in it.items():
-                val = v["_text"] if isinstance(v, dict) and "_text" in v and len(v) == 1 else v
-                if isinstance(val, str):
-                    simple[k] = strip_html(val)
-                else:
-                    simple[k] = val
-        else:
-            simple["content"] = strip_html(str(it))
-        items.append(simple)
-    return items
+def article_key(url: str) -> str:
+    """Chuẩn hóa URL bài viết (bỏ query/fragment, host viết thường) làm khóa cache"""
+    parts = urllib.parse.urlsplit(url.strip())
+    return f"{parts.scheme.lower() or 'https'}://{parts.netloc.lower()}{parts.path}"
+
+def format_articles(items: list, category: str) -> list:
+    """Chuyển item RSS đã parse thành danh sách bài viết trả về cho client"""
+    articles = []
+    for item in items:
+        article = {
+            "title": item.get("title", "Không có tiêu đề"),
+            "url": item.get("link", ""),
+            "description": item.get("description", "")[:300] + "..." if len(item.get("description", "")) > 300 else item.get("description", ""),
+            "pubDate": item.get("pubDate", ""),
+            "category": category
+        }
+        articles.append(article)
+    return articles
 
 @mcp.tool()
-def get_vnexpress_news(category: str = "home", limit: int = 10) -> dict:
+async def get_vnexpress_news(category: str = "home", limit: int = 10) -> dict:
     """
     Lấy tin tức mới nhất từ VnExpress qua RSS feed.
     
@@ -134,26 +117,9 @@ def get_vnexpress_news(category: str = "home", limit: int = 10) -> dict:
     try:
         logger.info(f"Fetching RSS from: {url}")
         
-        req = urllib.request.Request(url, headers={
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-        })
+        items = await feed_cache.get(url, limit=limit, timeout=10)
         
-        with urllib.request.urlopen(req, timeout=10) as response:
-            xml_content = response.read().decode('utf-8')
-        
-        parsed = parse_xml_to_dict(xml_content)
-        items = extract_rss_items(parsed)
-        
-        articles = []
-        for item in items[:limit]:
-            article = {
-                "title": item.get("title", "Không có tiêu đề"),
-                "url": item.get("link", ""),
-                "description": item.get("description", "")[:300] + "..." if len(item.get("description", "")) > 300 else item.get("description", ""),
-                "pubDate": item.get("pubDate", ""),
-                "category": category
-            }
-            articles.append(article)
+        articles = format_articles(items, category)
         
         logger.info(f"Successfully fetched {len(articles)} articles from {category}")
         
@@ -170,72 +136,125 @@ def get_vnexpress_news(category: str = "home", limit: int = 10) -> dict:
         return {"success": False, "error": str(e)}
 
 @mcp.tool()
-def get_article_content(url: str) -> dict:
+async def get_vnexpress_news_batch(categories: list[str], limit: int = 5) -> dict:
+    """
+    Lấy tin mới nhất của nhiều chủ đề VnExpress trong một lần gọi (ví dụ bản tin buổi sáng:
+    ["thoi-su", "the-gioi", "kinh-doanh", "the-thao"]). Các feed được tải song song,
+    chủ đề trùng feed (home/tin-moi, xe/oto-xe-may) chỉ tải một lần và bài trùng được gộp.
+    Categories giống get_vnexpress_news; tối đa `limit` bài mỗi chủ đề.
+    """
+    # Gộp các chủ đề trỏ cùng một feed, giữ thứ tự yêu cầu
+    feeds = {}
+    unknown = []
+    for category in dict.fromkeys(categories):
+        url = RSS_FEEDS.get(category)
+        if url is None:
+            unknown.append(category)
+        else:
+            feeds.setdefault(url, []).append(category)
+    
+    if not feeds:
+        return {"success": False, "error": f"Không có chủ đề hợp lệ: {', '.join(unknown) or 'trống'}"}
+    
+    slots = asyncio.Semaphore(BATCH_CONCURRENCY)
+    
+    async def fetch(url):
+        async with slots:
+            return await feed_cache.get(url, limit=limit, timeout=10)
+    
+    logger.info(f"Fetching {len(feeds)} RSS feeds for {len(categories)} categories")
+    results = await asyncio.gather(*(fetch(url) for url in feeds), return_exceptions=True)
+    
+    articles = []
+    seen = set()
+    errors = {}
+    for (url, aliases), result in zip(feeds.items(), results):
+        category = aliases[0]
+        if isinstance(result, Exception):
+            logger.error(f"Error fetching news for {category}: {result}")
+            errors[category] = str(result)
+            continue
+        for article in format_articles(result, category):
+            key = article["url"] or article["title"]
+            if key in seen:
+                continue
+            seen.add(key)
+            articles.append(article)
+    
+    response = {
+        "success": len(errors) < len(feeds),
+        "categories": [category for aliases in feeds.values() for category in aliases],
+        "total_articles": len(articles),
+        "articles": articles,
+        "source": "VnExpress.net"
+    }
+    if errors:
+        response["errors"] = errors
+    if unknown:
+        response["unknown_categories"] = unknown
+    return response
+
+@mcp.tool()
+async def get_article_content(url: str) -> dict:
     """Lấy nội dung chi tiết của một bài báo từ URL VnExpress"""
     try:
+        key = article_key(url)
+        cached = article_cache.get(key)
+        if cached is not None:
+            logger.info(f"Article cache hit: {url}")
+            return {**cached, "url": url}
+
         logger.info(f"Fetching article content from: {url}")
         
-        req = urllib.request.Request(url, headers={
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-        })
-        
-        with urllib.request.urlopen(req, timeout=15) as response:
-            html = response.read().decode('utf-8')
+        html = await article_flight.do(key, http_client.fetch_text, url, timeout=15)
         
         # Tìm tiêu đề
-        title_match = re.search(r'<h1[^>]*class="[^"]*title-detail[^"]*"[^>]*>(.*?)</h1>', html, re.DOTALL)
-        title = strip_html(title_match.group(1)) if title_match else "Không tìm thấy tiêu đề"
+        title_match = _TITLE_RE.search(html)
+        title = clean_text(title_match.group(1)) if title_match else "Không tìm thấy tiêu đề"
         
         # Tìm mô tả/lead
-        desc_match = re.search(r'<p[^>]*class="[^"]*description[^"]*"[^>]*>(.*?)</p>', html, re.DOTALL)
-        description = strip_html(desc_match.group(1)) if desc_match else ""
+        desc_match = _DESCRIPTION_RE.search(html)
+        description = clean_text(desc_match.group(1)) if desc_match else ""
         
-        # Tìm nội dung chính - lấy tất cả paragraphs trong article body
-        paragraphs = re.findall(r'<p[^>]*>(.*?)</p>', html, re.DOTALL)
-        clean_paras = [strip_html(p) for p in paragraphs if strip_html(p) and len(strip_html(p)) > 20]
-        content = "\n\n".join(clean_paras[:20])
+        # Tìm nội dung chính - một lượt qua các paragraph, dừng khi đủ ARTICLE_MAX_CHARS
+        paragraphs = extract_paragraphs(
+            html, max_chars=ARTICLE_MAX_CHARS, max_count=ARTICLE_MAX_PARAGRAPHS, min_length=21
+        )
+        content = "\n\n".join(paragraphs)
         
         # Tìm thời gian
-        time_match = re.search(r'<span[^>]*class="[^"]*date[^"]*"[^>]*>(.*?)</span>', html, re.DOTALL)
-        publish_time = strip_html(time_match.group(1)) if time_match else ""
+        time_match = _DATE_RE.search(html)
+        publish_time = clean_text(time_match.group(1)) if time_match else ""
         
-        return {
+        result = {
             "success": True,
             "title": title,
             "description": description,
-            "content": content[:2000] + "..." if len(content) > 2000 else content,
+            "content": content[:ARTICLE_MAX_CHARS] + "..." if len(content) > ARTICLE_MAX_CHARS else content,
             "publish_time": publish_time,
             "url": url
         }
+        article_cache.set(key, result)
+        return result
         
     except Exception as e:
         logger.error(f"Error fetching article content: {e}")
         return {"success": False, "error": str(e)}
 
 @mcp.tool() 
-def search_vnexpress_news(keyword: str, limit: int = 5) -> dict:
+async def search_vnexpress_news(keyword: str, limit: int = 5) -> dict:
     """Tìm kiếm tin tức trên VnExpress theo từ khóa"""
     try:
-        import urllib.parse
         encoded_keyword = urllib.parse.quote_plus(keyword)
         search_url = f"https://timkiem.vnexpress.net/?q={encoded_keyword}"
         
         logger.info(f"Searching VnExpress for: {keyword}")
         
-        req = urllib.request.Request(search_url, headers={
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-        })
-        
-        with urllib.request.urlopen(req, timeout=15) as response:
-            html = response.read().decode('utf-8')
-        
-        # Tìm các tiêu đề bài viết trong kết quả tìm kiếm
-        title_matches = re.findall(r'<h3[^>]*class="[^"]*title-news[^"]*"[^>]*>.*?<a[^>]*href="([^"]*)"[^>]*>(.*?)</a>', html, re.DOTALL)
+        html = await http_client.fetch_text(search_url, timeout=15)
         
+        # Tìm các tiêu đề bài viết (kèm description gần link) trong kết quả tìm kiếm
         articles = []
-        for href, title_html in title_matches[:limit]:
-            title = strip_html(title_html)
-            
+        for href, title, description in extract_headlines(html, limit):
             # Tạo URL đầy đủ
             if href.startswith('/'):
                 full_url = f"https://vnexpress.net{href}"
@@ -244,11 +263,6 @@ def search_vnexpress_news(keyword: str, limit: int = 5) -> dict:
             else:
                 full_url = f"https://vnexpress.net/{href}"
             
-            # Tìm description gần với link này
-            desc_pattern = rf'{re.escape(href)}.*?<p[^>]*class="[^"]*description[^"]*"[^>]*>(.*?)</p>'
-            desc_match = re.search(desc_pattern, html, re.DOTALL)
-            description = strip_html(desc_match.group(1)) if desc_match else ""
-            
             articles.append({
                 "title": title,
                 "url": full_url,
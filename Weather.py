@@ -1,9 +1,13 @@
 from fastmcp import FastMCP
 import sys
+import asyncio
 import logging
-import requests
+import time
+import httpx
+import http_client
 import os
 from datetime import datetime
+from cache_utils import SingleFlight, TTLCache
 
 logger = logging.getLogger('Weather')
 
@@ -15,8 +19,120 @@ if sys.platform == 'win32':
 # Create an MCP server
 mcp = FastMCP("Weather")
 
+API_BASE = "http://api.openweathermap.org/data/2.5"
+UNITS = "metric"  # Celsius
+LANG = "vi"  # Tiếng Việt
+
+# Cache theo (city, country_code, units, lang): thời tiết hiện tại ~10 phút, dự báo ~1 giờ.
+# Khi đã hết hạn, bản cũ vẫn được trả về nếu API trả lời chậm hơn WEATHER_STALE_WAIT giây
+# (stale-while-revalidate), miễn là chưa quá WEATHER_MAX_STALE giây.
+CURRENT_TTL = float(os.getenv("WEATHER_CURRENT_TTL", "600"))
+FORECAST_TTL = float(os.getenv("WEATHER_FORECAST_TTL", "3600"))
+CACHE_SIZE = int(os.getenv("WEATHER_CACHE_SIZE", "256"))
+STALE_WAIT = float(os.getenv("WEATHER_STALE_WAIT", "1.5"))
+MAX_STALE = float(os.getenv("WEATHER_MAX_STALE", "21600"))
+# get_weather dùng mốc dự báo 3 giờ đã cache nếu mốc gần nhất cách hiện tại không quá
+# WEATHER_FORECAST_WINDOW giây, thay vì gọi thêm /weather (0 để tắt)
+FORECAST_WINDOW = float(os.getenv("WEATHER_FORECAST_WINDOW", "5400"))
+# Ghi thống kê cache (hit/miss, stale, request dùng chung) vào log mỗi WEATHER_STATS_INTERVAL
+# giây để chọn WEATHER_CACHE_SIZE/TTL phù hợp (0 để tắt)
+STATS_INTERVAL = float(os.getenv("WEATHER_STATS_INTERVAL", "3600"))
+
+weather_caches = {
+    "weather": TTLCache(maxsize=CACHE_SIZE, ttl=CURRENT_TTL),
+    "forecast": TTLCache(maxsize=CACHE_SIZE, ttl=FORECAST_TTL),
+}
+stale_served = 0
+derived_from_forecast = 0
+stats_logged_at = time.monotonic()
+# Các thiết bị hỏi cùng một thành phố cùng lúc dùng chung một request tới API
+weather_flight = SingleFlight()
+
+
+def weather_key(city: str, country_code: str) -> tuple:
+    return (" ".join(city.split()).casefold(), country_code.strip().upper(), UNITS, LANG)
+
+
+async def _fetch(endpoint: str, key: tuple, city: str, country_code: str, api_key: str) -> tuple:
+    params = {"q": f"{city},{country_code}", "appid": api_key, "units": UNITS, "lang": LANG}
+    data = await http_client.fetch_json(f"{API_BASE}/{endpoint}", params=params, timeout=10)
+    entry = (data, time.time())
+    weather_caches[endpoint].set(key, entry)
+    return entry
+
+
+async def cached_fetch(endpoint: str, city: str, country_code: str, api_key: str) -> tuple:
+    """Trả về (data, fetched_at, stale) của endpoint OpenWeatherMap cho thành phố, qua cache"""
+    global stale_served
+    log_cache_stats()
+    cache = weather_caches[endpoint]
+    key = weather_key(city, country_code)
+    entry = cache.peek(key)
+    if entry is not None and entry[1]:
+        cache.hits += 1
+        logger.info(f"Weather cache hit: {endpoint} {key[:2]} ({cache.hits} hits / {cache.misses} misses)")
+        return (*entry[0], False)
+    cache.misses += 1
+
+    refresh = weather_flight.do((endpoint, key), _fetch, endpoint, key, city, country_code, api_key)
+
+    if entry is None or time.time() - entry[0][1] > MAX_STALE:
+        return (*await refresh, False)
+    try:
+        # Hết thời gian chờ chỉ bỏ lượt chờ này; request chung vẫn chạy tiếp và cập nhật cache
+        return (*await asyncio.wait_for(refresh, STALE_WAIT), False)
+    except asyncio.TimeoutError:
+        logger.warning(f"OpenWeatherMap slow, serving stale {endpoint} for {key[:2]}")
+    except Exception as e:
+        logger.warning(f"OpenWeatherMap refresh failed, serving stale {endpoint} for {key[:2]}: {e}")
+    stale_served += 1
+    return (*entry[0], True)
+
+
+def current_from_forecast(city: str, country_code: str) -> tuple | None:
+    """Dựng phản hồi dạng /weather từ mốc gần nhất của bản dự báo còn hạn trong cache"""
+    global derived_from_forecast
+    if FORECAST_WINDOW <= 0:
+        return None
+    entry = weather_caches["forecast"].peek(weather_key(city, country_code))
+    if entry is None or not entry[1] or not entry[0][0].get("list"):
+        return None
+    data, fetched_at = entry[0]
+    now = time.time()
+    item = min(data["list"], key=lambda i: abs(i["dt"] - now))
+    if abs(item["dt"] - now) > FORECAST_WINDOW:
+        return None
+    derived_from_forecast += 1
+    return {
+        "name": data["city"]["name"],
+        "sys": {"country": data["city"]["country"]},
+        "main": item["main"],
+        "weather": item["weather"],
+        "wind": item["wind"],
+        "visibility": item.get("visibility", "N/A"),
+    }, fetched_at
+
+
+def weather_cache_stats() -> dict:
+    return {
+        **{endpoint: cache.stats() for endpoint, cache in weather_caches.items()},
+        "requests": weather_flight.stats(),
+        "stale_served": stale_served,
+        "derived_from_forecast": derived_from_forecast,
+    }
+
+
+def log_cache_stats():
+    """Ghi weather_cache_stats() vào log nếu đã quá STATS_INTERVAL giây kể từ lần trước"""
+    global stats_logged_at
+    now = time.monotonic()
+    if STATS_INTERVAL <= 0 or now - stats_logged_at < STATS_INTERVAL:
+        return
+    stats_logged_at = now
+    logger.info(f"Weather cache stats: {weather_cache_stats()}")
+
 @mcp.tool()
-def get_weather(city: str, country_code: str = "VN") -> dict:
+async def get_weather(city: str, country_code: str = "VN") -> dict:
     """Get current weather information for a specific city. Use country_code like 'VN', 'US', 'JP', etc."""
     try:
         # Sử dụng OpenWeatherMap API (miễn phí)
@@ -25,21 +141,18 @@ def get_weather(city: str, country_code: str = "VN") -> dict:
         if not api_key:
             return {"success": False, "error": "OPENWEATHER_API_KEY not configured"}
         
-        # API endpoint
-        url = f"http://api.openweathermap.org/data/2.5/weather"
-        params = {
-            "q": f"{city},{country_code}",
-            "appid": api_key,
-            "units": "metric",  # Celsius
-            "lang": "vi"  # Tiếng Việt
-        }
-        
         logger.info(f"Getting weather for: {city}, {country_code}")
         
-        response = requests.get(url, params=params, timeout=10)
-        response.raise_for_status()
-        
-        data = response.json()
+        # Thời tiết hiện tại còn hạn trong cache, nếu không thì lấy từ bản dự báo đã có
+        # (một phản hồi /forecast phục vụ cả hai tool), cuối cùng mới gọi /weather
+        cached = weather_caches["weather"].peek(weather_key(city, country_code))
+        derived = None if cached is not None and cached[1] else current_from_forecast(city, country_code)
+        if derived is not None:
+            data, fetched_at = derived
+            stale = False
+            logger.info(f"Current weather for {city} derived from cached forecast")
+        else:
+            data, fetched_at, stale = await cached_fetch("weather", city, country_code, api_key)
         
         # Trích xuất thông tin quan trọng
         weather_info = {
@@ -52,18 +165,23 @@ def get_weather(city: str, country_code: str = "VN") -> dict:
             "weather": data["weather"][0]["description"],
             "wind_speed": data["wind"]["speed"],
             "visibility": data.get("visibility", "N/A"),
-            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            "timestamp": datetime.fromtimestamp(fetched_at).strftime("%Y-%m-%d %H:%M:%S")
         }
         
         logger.info(f"Weather data retrieved for {city}: {weather_info['temperature']}°C, {weather_info['weather']}")
         
-        return {
+        result = {
             "success": True,
             "data": weather_info,
             "message": f"Weather in {weather_info['city']}: {weather_info['temperature']}°C, {weather_info['weather']}"
         }
+        if stale:
+            result["stale"] = True
+        if derived is not None:
+            result["source"] = "forecast"
+        return result
         
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
         logger.error(f"Network error: {e}")
         return {"success": False, "error": f"Network error: {str(e)}"}
     except KeyError as e:
@@ -74,31 +192,20 @@ def get_weather(city: str, country_code: str = "VN") -> dict:
         return {"success": False, "error": f"Unexpected error: {str(e)}"}
 
 @mcp.tool()
-def get_weather_forecast(city: str, country_code: str = "VN", days: int = 3) -> dict:
+async def get_weather_forecast(city: str, country_code: str = "VN", days: int = 3) -> dict:
     """Get weather forecast for multiple days (1-5 days)."""
     try:
         api_key = os.getenv("OPENWEATHER_API_KEY")
         if not api_key:
             return {"success": False, "error": "OPENWEATHER_API_KEY not configured"}
         
-        url = f"http://api.openweathermap.org/data/2.5/forecast"
-        params = {
-            "q": f"{city},{country_code}",
-            "appid": api_key,
-            "units": "metric",
-            "lang": "vi",
-            "cnt": min(days * 8, 40)  # 8 forecasts per day (every 3 hours), max 40
-        }
-        
         logger.info(f"Getting {days}-day forecast for: {city}, {country_code}")
         
-        response = requests.get(url, params=params, timeout=10)
-        response.raise_for_status()
-        
-        data = response.json()
+        # Luôn lấy đủ 40 mốc (5 ngày x 8 mốc 3 giờ) để mọi giá trị `days` dùng chung một bản cache
+        data, fetched_at, stale = await cached_fetch("forecast", city, country_code, api_key)
         
         forecasts = []
-        for item in data["list"]:
+        for item in data["list"][:min(days * 8, 40)]:  # 8 forecasts per day (every 3 hours), max 40
             forecast = {
                 "datetime": item["dt_txt"],
                 "temperature": item["main"]["temp"],
@@ -108,13 +215,16 @@ def get_weather_forecast(city: str, country_code: str = "VN", days: int = 3) ->
             }
             forecasts.append(forecast)
         
-        return {
+        result = {
             "success": True,
             "city": data["city"]["name"],
             "country": data["city"]["country"],
             "forecasts": forecasts,
             "message": f"{days}-day forecast for {data['city']['name']}"
         }
+        if stale:
+            result["stale"] = True
+        return result
         
     except Exception as e:
         logger.error(f"Forecast error: {e}")
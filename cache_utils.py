@@ -0,0 +1,115 @@
+# coding: utf-8
+"""
+Small in-memory caching helpers shared by the MCP servers.
+- TTLCache: LRU-bounded mapping whose entries expire after a TTL.
+- SingleFlight: concurrent calls with the same key share one in-flight
+  upstream request and its result.
+"""
+
+import asyncio
+import time
+from collections import OrderedDict
+
+_MISSING = object()
+
+
+class TTLCache:
+    """LRU cache with per-entry expiry.
+
+    Expired entries are kept (until evicted) so callers can still use them
+    for revalidation or as a stale fallback through :meth:`peek`.
+    """
+
+    def __init__(self, maxsize=128, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()  # key -> (expires_at, value)
+
+    def get(self, key, default=None):
+        """Return the fresh value for ``key`` or ``default``, counting hits/misses."""
+        item = self._data.get(key, _MISSING)
+        if item is _MISSING or item[0] <= time.monotonic():
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return item[1]
+
+    def peek(self, key):
+        """Return ``(value, fresh)`` for ``key`` even if expired, or ``None``."""
+        item = self._data.get(key, _MISSING)
+        if item is _MISSING:
+            return None
+        self._data.move_to_end(key)
+        return item[1], item[0] > time.monotonic()
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        self._data[key] = (time.monotonic() + ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def replace(self, key, value):
+        """Swap the value stored under ``key`` without touching its expiry."""
+        item = self._data.get(key, _MISSING)
+        if item is _MISSING:
+            self.set(key, value)
+        else:
+            self._data[key] = (item[0], value)
+
+    def pop(self, key, default=None):
+        item = self._data.pop(key, _MISSING)
+        return default if item is _MISSING else item[1]
+
+    def clear(self):
+        self._data.clear()
+
+    def stats(self):
+        return {"size": len(self._data), "maxsize": self.maxsize, "hits": self.hits, "misses": self.misses}
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return self.peek(key) is not None
+
+
+class SingleFlight:
+    """Coalesce concurrent identical async calls into one.
+
+    The first caller for a key starts the call as a task; callers arriving
+    while it runs await the same task and get the same result (or exception).
+    The task is shielded, so one caller being cancelled does not abort the
+    request for the others. Keys are forgotten as soon as the call finishes,
+    so this is not a cache.
+    """
+
+    def __init__(self):
+        self.started = 0
+        self.shared = 0
+        self._calls = {}  # key -> Task
+
+    async def do(self, key, func, *args, **kwargs):
+        """Return ``await func(*args, **kwargs)``, sharing it with concurrent callers of ``key``."""
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(func(*args, **kwargs))
+            self._calls[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+            self.started += 1
+        else:
+            self.shared += 1
+        return await asyncio.shield(task)
+
+    def _forget(self, key, task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+
+    def in_flight(self, key):
+        return key in self._calls
+
+    def stats(self):
+        return {"in_flight": len(self._calls), "started": self.started, "shared": self.shared}
@@ -0,0 +1,457 @@
+# coding: utf-8
+"""
+Sandboxed evaluation of calculator expressions.
+- compile_expression: parse, validate the AST against a whitelist (arithmetic,
+  comparisons, comprehensions, math/random and a few safe builtins) and
+  compile; compiled code objects are kept in an LRU cache.
+- evaluate_batch: several expressions over shared variables in one go; when
+  variables are arrays each expression is vectorized (NumPy when the worker
+  has it, otherwise a compiled element-wise loop).
+- SandboxPool: evaluates expressions in long-lived worker subprocesses that
+  run under a CPU-time and address-space limit; a worker that exceeds its
+  hard timeout or crashes is killed and replaced, so one pathological
+  expression (9**9**9, sum(range(10**12))) cannot stall the server.
+
+The worker is this file run as a script: it reads one JSON request per line
+on stdin and answers one JSON line on stdout. It only imports the standard
+library so it starts in a few milliseconds; NumPy (optional) is imported the
+first time a batch with array variables arrives.
+
+Env overrides:
+    CALC_WORKERS       worker processes (default 2)
+    CALC_TIMEOUT       wall-clock seconds per evaluation before the worker is killed (default 3)
+    CALC_CPU_SECONDS   CPU seconds per evaluation (default 2, POSIX only)
+    CALC_MEMORY_MB     address-space limit of a worker in MiB (default 512, POSIX only)
+    CALC_CACHE_SIZE    compiled expressions kept in the LRU cache (default 512)
+"""
+
+import ast
+import asyncio
+import builtins
+import contextlib
+import functools
+import json
+import logging
+import math
+import os
+import random
+import sys
+
+logger = logging.getLogger('CalcSandbox')
+
+CALC_WORKERS = int(os.getenv("CALC_WORKERS", "2"))
+CALC_TIMEOUT = float(os.getenv("CALC_TIMEOUT", "3"))
+CALC_CPU_SECONDS = int(os.getenv("CALC_CPU_SECONDS", "2"))
+CALC_MEMORY_MB = int(os.getenv("CALC_MEMORY_MB", "512"))
+CALC_CACHE_SIZE = int(os.getenv("CALC_CACHE_SIZE", "512"))
+
+MAX_EXPRESSION_LENGTH = 2000
+MAX_BATCH_EXPRESSIONS = 100
+MAX_ARRAY_LENGTH = 10000
+MAX_POWER_BITS = 1_000_000  # reject constant powers whose result would exceed this many bits
+
+SAFE_BUILTINS = {
+    name: getattr(builtins, name)
+    for name in (
+        "abs", "all", "any", "bin", "bool", "complex", "divmod", "enumerate", "filter", "float",
+        "hex", "int", "len", "list", "map", "max", "min", "oct", "pow", "range", "reversed",
+        "round", "sorted", "str", "sum", "tuple", "zip",
+    )
+}
+MODULES = {"math": math, "random": random}
+# random.* functions that change the generator state shared by later requests
+_STATEFUL_ATTRIBUTES = {"seed", "setstate"}
+
+_ALLOWED_NODES = (
+    ast.Expression, ast.Constant, ast.Name, ast.Load, ast.Store, ast.Starred,
+    ast.BinOp, ast.UnaryOp, ast.BoolOp, ast.Compare, ast.IfExp, ast.Call, ast.keyword,
+    ast.Attribute, ast.Subscript, ast.Slice, ast.List, ast.Tuple, ast.Set, ast.Dict,
+    ast.ListComp, ast.SetComp, ast.DictComp, ast.GeneratorExp, ast.comprehension,
+    ast.operator, ast.unaryop, ast.boolop, ast.cmpop,
+)
+
+
+class ExpressionError(ValueError):
+    """The expression is not allowed or cannot be evaluated."""
+
+
+def _check_power(node):
+    base, exponent = node.left, node.right
+    if not (isinstance(base, ast.Constant) and isinstance(exponent, ast.Constant)):
+        return
+    if not all(isinstance(c.value, (int, float)) and not isinstance(c.value, bool) for c in (base, exponent)):
+        return
+    if abs(base.value) > 1 and exponent.value > 0 and exponent.value * math.log2(abs(base.value)) > MAX_POWER_BITS:
+        raise ExpressionError("Exponent too large")
+
+
+def validate(tree):
+    """Raise ExpressionError unless every node of ``tree`` is whitelisted."""
+    for node in ast.walk(tree):
+        if not isinstance(node, _ALLOWED_NODES):
+            raise ExpressionError(f"'{type(node).__name__}' is not allowed")
+        if isinstance(node, ast.Name) and node.id.startswith("_"):
+            raise ExpressionError(f"Name '{node.id}' is not allowed")
+        if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Store):
+            # `[math.x for math in ...]` would turn the attribute check below into getattr on anything
+            if node.id in MODULES or node.id in SAFE_BUILTINS:
+                raise ExpressionError(f"Cannot assign to '{node.id}'")
+        if isinstance(node, ast.Attribute):
+            if not (isinstance(node.value, ast.Name) and node.value.id in MODULES) or node.attr.startswith("_"):
+                raise ExpressionError("Only math.* and random.* attributes are allowed")
+            if node.attr in _STATEFUL_ATTRIBUTES:
+                raise ExpressionError(f"'{node.value.id}.{node.attr}' is not allowed")
+        if isinstance(node, ast.BinOp) and isinstance(node.op, ast.Pow):
+            _check_power(node)
+
+
+@functools.lru_cache(maxsize=CALC_CACHE_SIZE)
+def compile_expression(expression):
+    """Parse, validate and compile ``expression``; cached by expression string."""
+    if len(expression) > MAX_EXPRESSION_LENGTH:
+        raise ExpressionError(f"Expression longer than {MAX_EXPRESSION_LENGTH} characters")
+    try:
+        tree = ast.parse(expression.strip(), mode="eval")
+        validate(tree)
+        return compile(tree, "<calculator>", "eval")
+    except SyntaxError as e:
+        raise ExpressionError(f"Invalid syntax: {e.msg}") from None
+    except (RecursionError, MemoryError):
+        # e.g. '-'*1990 + '1': the parser itself runs out of stack
+        raise ExpressionError("Expression is too deeply nested") from None
+
+
+def evaluate(expression, variables=None):
+    """Evaluate ``expression`` in this process (no resource limits; used by the worker)."""
+    code = compile_expression(expression)
+    namespace = {"__builtins__": SAFE_BUILTINS, **MODULES}
+    if variables:
+        namespace.update(variables)
+    result = eval(code, namespace)
+    # Generators, ranges, maps... are materialized so they can be returned
+    if isinstance(result, (range, map, filter, zip, enumerate, reversed)) or type(result).__name__ == "generator":
+        result = list(result)
+    return result
+
+
+def check_variables(variables):
+    """Validate batch variables: identifiers mapping to numbers or equal-length number lists.
+
+    Returns the common array length, or None when every variable is a scalar.
+    """
+    length = None
+    for name, value in (variables or {}).items():
+        if not name.isidentifier() or name.startswith("_") or name in MODULES or name in SAFE_BUILTINS:
+            raise ExpressionError(f"Invalid variable name '{name}'")
+        if isinstance(value, list):
+            if len(value) > MAX_ARRAY_LENGTH:
+                raise ExpressionError(f"Variable '{name}' has more than {MAX_ARRAY_LENGTH} values")
+            if length is not None and len(value) != length:
+                raise ExpressionError("All array variables must have the same length")
+            length = len(value)
+    return length
+
+
+class _VectorMath:
+    """``math`` stand-in for NumPy arrays: ufuncs where they exist, np.vectorize otherwise."""
+
+    _UFUNCS = {
+        "sqrt": "sqrt", "exp": "exp", "log10": "log10", "log2": "log2", "log1p": "log1p",
+        "sin": "sin", "cos": "cos", "tan": "tan", "asin": "arcsin", "acos": "arccos",
+        "atan": "arctan", "atan2": "arctan2", "sinh": "sinh", "cosh": "cosh", "tanh": "tanh",
+        "floor": "floor", "ceil": "ceil", "trunc": "trunc", "fabs": "fabs", "pow": "power",
+        "hypot": "hypot", "degrees": "degrees", "radians": "radians", "isnan": "isnan",
+    }
+
+    def __init__(self, np):
+        self._np = np
+
+    def log(self, x, base=None):
+        np = self._np
+        return np.log(x) if base is None else np.log(x) / np.log(base)
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        if name in self._UFUNCS:
+            return getattr(self._np, self._UFUNCS[name])
+        value = getattr(math, name)
+        return self._np.vectorize(value) if callable(value) else value
+
+
+def _import_numpy():
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+
+def _numpy_pass(code, variables, np, dtype=None):
+    namespace = {"__builtins__": SAFE_BUILTINS, "math": _VectorMath(np), "random": random}
+    namespace.update({k: np.asarray(v, dtype=dtype) if isinstance(v, list) else v for k, v in variables.items()})
+    # Raise like plain numbers would (1/0, sqrt(-1)) so the loop below reports it
+    with np.errstate(divide="raise", invalid="raise"):
+        return eval(code, namespace)
+
+
+def _vectorized(code, variables, length, np):
+    """Evaluate ``code`` over array variables, one NumPy pass if possible, else element-wise.
+
+    The result is a list with one value per element, or a single value for
+    aggregations such as ``sum(payment)``.
+    """
+    if np is not None:
+        try:
+            result = _numpy_pass(code, variables, np)
+            shape = getattr(result, "shape", ())
+            if getattr(result, "dtype", None) is not None and result.dtype.kind in "iu":
+                # int64 wraps around silently; trust it only if a float pass agrees
+                check = _numpy_pass(code, variables, np, dtype=float)
+                if not np.allclose(result, check, rtol=1e-9, atol=0):
+                    raise OverflowError("integer overflow")
+            if shape == (length,):
+                return result.tolist()
+            if shape == ():
+                return result.item() if hasattr(result, "item") else result
+        except Exception:
+            pass  # e.g. `a if x > 0 else b` on arrays; the element-wise loop handles it
+    namespace = {"__builtins__": SAFE_BUILTINS, **MODULES}
+    results = []
+    try:
+        for i in range(length):
+            namespace.update({k: v[i] if isinstance(v, list) else v for k, v in variables.items()})
+            results.append(eval(code, namespace))
+    except TypeError as e:
+        # Aggregations (sum(x), len(x), max(x)) need the whole list
+        namespace.update(variables)
+        try:
+            result = eval(code, namespace)
+        except Exception:
+            raise e from None
+        if isinstance(result, (list, tuple)):
+            raise e
+        return result
+    return results
+
+
+def evaluate_batch(expressions, variables=None):
+    """Evaluate every expression with ``variables``; return a list of (ok, result_or_error).
+
+    Expressions that use array variables give a list with one value per element,
+    or one value when they aggregate the array (``sum(x)``).
+    """
+    variables = variables or {}
+    length = check_variables(variables)
+    np = _import_numpy() if length is not None else None
+    arrays = {name for name, value in variables.items() if isinstance(value, list)}
+    results = []
+    for expression in expressions:
+        try:
+            code = compile_expression(expression)
+            if length is None or not arrays.intersection(code.co_names):
+                results.append((True, evaluate(expression, variables)))
+            else:
+                results.append((True, _vectorized(code, variables, length, np)))
+        except MemoryError:
+            raise
+        except ExpressionError as e:
+            results.append((False, str(e)))
+        except Exception as e:
+            results.append((False, f"{type(e).__name__}: {e}"))
+    return results
+
+
+# --- Worker side ------------------------------------------------------------
+
+def _limit_resources():
+    try:
+        import resource
+    except ImportError:  # Windows: only the parent's hard timeout applies
+        return None
+    limit = CALC_MEMORY_MB * 1024 * 1024
+    with contextlib.suppress(ValueError, OSError):
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    return resource
+
+
+def _arm_cpu_limit(resource):
+    """Allow CALC_CPU_SECONDS more CPU time; past it the kernel kills the worker (SIGXCPU)."""
+    if resource is None:
+        return
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    soft = math.ceil(usage.ru_utime + usage.ru_stime) + CALC_CPU_SECONDS
+    hard = resource.getrlimit(resource.RLIMIT_CPU)[1]
+    with contextlib.suppress(ValueError, OSError):
+        resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+
+
+def _encode(value):
+    if hasattr(value, "tolist"):  # NumPy arrays and scalars
+        return value.tolist()
+    if isinstance(value, complex):
+        return str(value)
+    if isinstance(value, (set, frozenset)):
+        return sorted(value, key=repr)
+    return repr(value)
+
+
+def serve():
+    """Worker loop: one JSON request per stdin line, one JSON reply per stdout line."""
+    resource = _limit_resources()
+    for line in sys.stdin:
+        request = json.loads(line)
+        try:
+            _arm_cpu_limit(resource)
+            if "expressions" in request:
+                results = evaluate_batch(request["expressions"], request.get("variables"))
+                reply = {"ok": True, "results": [
+                    {"ok": True, "result": value} if ok else {"ok": False, "error": value} for ok, value in results
+                ]}
+            else:
+                reply = {"ok": True, "result": evaluate(request["expression"], request.get("variables"))}
+            payload = json.dumps(reply, default=_encode)
+        except MemoryError:
+            payload = json.dumps({"ok": False, "error": "Memory limit exceeded"})
+        except ExpressionError as e:
+            payload = json.dumps({"ok": False, "error": str(e)})
+        except Exception as e:
+            payload = json.dumps({"ok": False, "error": f"{type(e).__name__}: {e}"})
+        sys.stdout.write(payload + "\n")
+        sys.stdout.flush()
+
+
+# --- Server side ------------------------------------------------------------
+
+class _Worker:
+    def __init__(self, process):
+        self.process = process
+
+    @property
+    def alive(self):
+        return self.process.returncode is None
+
+    def kill(self):
+        if self.alive:
+            with contextlib.suppress(ProcessLookupError):
+                self.process.kill()
+
+
+class SandboxPool:
+    """Pool of resource-limited worker processes evaluating expressions."""
+
+    def __init__(self, workers=CALC_WORKERS, timeout=CALC_TIMEOUT):
+        self.size = workers
+        self.timeout = timeout
+        self.killed = 0
+        self._idle = None
+        self._loop = None
+        self._workers = []
+
+    async def _spawn(self):
+        process = await asyncio.create_subprocess_exec(
+            sys.executable, os.path.abspath(__file__),
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            limit=16 * 1024 * 1024,
+            # One BLAS thread: per-thread buffers would eat the address-space limit
+            env={**os.environ, "OPENBLAS_NUM_THREADS": "1", "OMP_NUM_THREADS": "1"},
+        )
+        worker = _Worker(process)
+        self._workers.append(worker)
+        return worker
+
+    def _ensure_pool(self):
+        loop = asyncio.get_running_loop()
+        if self._idle is None or self._loop is not loop:
+            self._idle = asyncio.Queue()
+            self._loop = loop
+            self._workers = []
+            for _ in range(self.size):
+                self._idle.put_nowait(None)  # slot, spawned on first use
+
+    async def evaluate(self, expression, variables=None, timeout=None):
+        """Evaluate in a worker and return the result; raise ExpressionError on failure."""
+        compile_expression(expression)  # reject bad input before using a worker
+        reply = await self._request({"expression": expression, "variables": variables}, timeout)
+        return reply["result"]
+
+    async def evaluate_batch(self, expressions, variables=None, timeout=None):
+        """Evaluate several expressions in one worker round trip.
+
+        Returns one ``{"ok": True, "result": ...}`` or ``{"ok": False, "error": ...}``
+        per expression; raises ExpressionError if the batch as a whole fails.
+        """
+        if not expressions:
+            raise ExpressionError("No expressions given")
+        if len(expressions) > MAX_BATCH_EXPRESSIONS:
+            raise ExpressionError(f"At most {MAX_BATCH_EXPRESSIONS} expressions per batch")
+        check_variables(variables)
+        reply = await self._request({"expressions": expressions, "variables": variables}, timeout)
+        return reply["results"]
+
+    async def _request(self, payload, timeout=None):
+        self._ensure_pool()
+        timeout = timeout or self.timeout
+        worker = await self._idle.get()
+        try:
+            if worker is None or not worker.alive:
+                worker = await self._spawn()
+            worker.process.stdin.write((json.dumps(payload) + "\n").encode("utf-8"))
+            await worker.process.stdin.drain()
+            try:
+                line = await asyncio.wait_for(worker.process.stdout.readline(), timeout)
+            except asyncio.TimeoutError:
+                self._discard(worker)
+                worker = None
+                raise ExpressionError(f"Calculation took longer than {timeout:g}s") from None
+            if not line:
+                self._discard(worker)
+                worker = None
+                raise ExpressionError("Calculation exceeded the CPU or memory limit")
+            reply = json.loads(line)
+            if not reply["ok"]:
+                raise ExpressionError(reply["error"])
+            return reply
+        except ExpressionError:
+            raise
+        except (BrokenPipeError, ConnectionResetError):
+            self._discard(worker)
+            worker = None
+            raise ExpressionError("Calculator worker exited unexpectedly") from None
+        except BaseException:
+            # Cancelled (or failed) mid-request: the worker may still owe a reply,
+            # so it must never serve another request
+            self._discard(worker, "request cancelled")
+            worker = None
+            raise
+        finally:
+            self._idle.put_nowait(worker)
+
+    def _discard(self, worker, reason="timeout or resource limit"):
+        if worker is None:
+            return
+        worker.kill()
+        self.killed += 1
+        with contextlib.suppress(ValueError):
+            self._workers.remove(worker)
+        logger.warning(f"Killed calculator worker ({reason})")
+
+    async def close(self):
+        for worker in self._workers:
+            worker.kill()
+            with contextlib.suppress(Exception):
+                await worker.process.wait()
+        self._workers = []
+        self._idle = None
+
+    def stats(self):
+        return {
+            "workers": len(self._workers),
+            "killed": self.killed,
+            "compile_cache": compile_expression.cache_info()._asdict(),
+        }
+
+
+if __name__ == "__main__":
+    serve()
@@ -2,8 +2,7 @@
 from fastmcp import FastMCP
 import sys
 import logging
-import math
-import random
+from calc_sandbox import ExpressionError, SandboxPool
 
 logger = logging.getLogger('Calculator')
 
@@ -15,14 +14,39 @@ if sys.platform == 'win32':
 # Create an MCP server
 mcp = FastMCP("Calculator")
 
+# Expressions are validated, cached and evaluated in resource-limited worker processes
+sandbox = SandboxPool()
+
 # Add an addition tool
 @mcp.tool()
-def calculator(python_expression: str) -> dict:
+async def calculator(python_expression: str) -> dict:
     """For mathamatical calculation, always use this tool to calculate the result of a python expression. You can use 'math' or 'random' directly, without 'import'."""
-    result = eval(python_expression, {"math": math, "random": random})
+    try:
+        result = await sandbox.evaluate(python_expression)
+    except ExpressionError as e:
+        logger.warning(f"Calculation failed for formula: {python_expression}: {e}")
+        return {"success": False, "error": str(e)}
     logger.info(f"Calculating formula: {python_expression}, result: {result}")
     return {"success": True, "result": result}
 
+@mcp.tool()
+async def calculator_batch(expressions: list[str], variables: dict[str, int | float | list[int | float]] | None = None) -> dict:
+    """Calculate several python expressions in one call, sharing the same `variables`.
+    A variable may be a number or a list of numbers (all lists the same length); expressions using lists are computed element-wise and return a list (aggregations such as sum(x) return one value), e.g. a 360-month amortization table from one formula over `month=[1..360]`. You can use 'math' or 'random' directly, without 'import'."""
+    try:
+        outcomes = await sandbox.evaluate_batch(expressions, variables)
+    except ExpressionError as e:
+        logger.warning(f"Batch calculation of {len(expressions)} formulas failed: {e}")
+        return {"success": False, "error": str(e)}
+    results = []
+    for expression, outcome in zip(expressions, outcomes):
+        if outcome["ok"]:
+            results.append({"expression": expression, "result": outcome["result"]})
+        else:
+            results.append({"expression": expression, "error": outcome["error"]})
+    logger.info(f"Calculated {len(expressions)} formulas, {sum(1 for r in results if 'error' in r)} failed")
+    return {"success": True, "results": results}
+
 # Start the server
 if __name__ == "__main__":
     mcp.run(transport="stdio")
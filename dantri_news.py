@@ -1,9 +1,12 @@
 from fastmcp import FastMCP
-import urllib.request
+import asyncio
+import os
 import urllib.parse
 import re
 import logging
 import sys
+import http_client
+from html_utils import clean_text, extract_paragraphs
 
 # Ensure UTF-8 output on Windows consoles
 if sys.platform == "win32":
@@ -15,57 +18,54 @@ mcp = FastMCP("Dantri News")
 logger = logging.getLogger("DantriNews")
 logging.basicConfig(level=logging.INFO)
 
+# Per-request timeout for every dantri.com.vn fetch (seconds)
+FETCH_TIMEOUT = float(os.getenv("DANTRI_TIMEOUT", "10"))
+# Start the fallback search if the category page has not answered after this
+# many seconds and take whichever result comes first; negative disables hedging
+HEDGE_DELAY = float(os.getenv("DANTRI_HEDGE_DELAY", "1.5"))
+# Category pages fetched at the same time by get_news_batch
+BATCH_CONCURRENCY = int(os.getenv("NEWS_BATCH_CONCURRENCY", "4"))
+
+# Category -> (page URL, fallback search query); aliases share one page
+CATEGORIES = {
+    "the-gioi": ("https://dantri.com.vn/the-gioi.htm", "the gioi"),
+    "thoi-su": ("https://dantri.com.vn/thoi-su.htm", "thoi su"),
+    "the-thao": ("https://dantri.com.vn/the-thao.htm", "the thao"),
+    "o-to-xe-may": ("https://dantri.com.vn/o-to-xe-may.htm", "oto xe may"),
+}
+CATEGORIES["oto-xe-may"] = CATEGORIES["xe"] = CATEGORIES["o-to-xe-may"]
+
+# Compiled once; used on every category and search page
+_ARTICLE_TITLE_RE = re.compile(r"<h3 class=\"article-title\">.*?<a[^>]*>(.*?)</a>", re.DOTALL)
+
+
+def extract_titles(html: str, limit: int = 5) -> list[str]:
+    """Return up to ``limit`` distinct, cleaned article titles from a Dantri listing page."""
+    titles: list[str] = []
+    for match in _ARTICLE_TITLE_RE.finditer(html):
+        title = clean_text(match.group(1))
+        if title and title not in titles:
+            titles.append(title)
+            if len(titles) >= limit:
+                break
+    return titles
+
 
-def fetch_dantri_news(url: str) -> list[str]:
+async def fetch_dantri_news(url: str) -> list[str]:
     """Fetch up to 5 latest news headlines from the given Dantri URL."""
     try:
-        headers = {
-            "User-Agent": (
-                "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
-                "AppleWebKit/537.36 (KHTML, like Gecko) "
-                "Chrome/91.0.4472.124 Safari/537.36"
-            )
-        }
-        req = urllib.request.Request(url, headers=headers)
-        with urllib.request.urlopen(req) as response:
-            html_content = response.read().decode("utf-8")
-        matches = re.findall(r"<h3 class=\"article-title\">.*?<a[^>]*>(.*?)</a>", html_content, re.DOTALL)
-        titles: list[str] = []
-        for match in matches:
-            clean_title = re.sub(r"<.*?>", "", match).strip()
-            clean_title = (
-                clean_title.replace("\u0026quot;", '"')
-                .replace("\u0026apos;", "'")
-                .replace("\u0026amp;", "&")
-                .replace("\u0026lt;", "<")
-                .replace("\u0026gt;", ">")
-            )
-            if clean_title and clean_title not in titles:
-                titles.append(clean_title)
-            if len(titles) >= 5:
-                break
-        return titles
+        html_content = await http_client.fetch_text(url, timeout=FETCH_TIMEOUT)
+        return extract_titles(html_content)
     except Exception as e:
         logger.error(f"Error fetching news from {url}: {e}")
         return [f"Error fetching news: {str(e)}"]
 
 
-def fetch_article_summary(url: str) -> str:
+async def fetch_article_summary(url: str) -> str:
     """Fetch the article page and return a ~200‑word plain‑text summary."""
     try:
-        headers = {
-            "User-Agent": (
-                "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
-                "AppleWebKit/537.36 (KHTML, like Gecko) "
-                "Chrome/91.0.4472.124 Safari/537.36"
-            )
-        }
-        req = urllib.request.Request(url, headers=headers)
-        with urllib.request.urlopen(req) as response:
-            html = response.read().decode("utf-8")
-        paragraphs = re.findall(r"<p[^>]*>(.*?)</p>", html, re.DOTALL)
-        clean_paras = [re.sub(r"<.*?>", "", p).strip() for p in paragraphs]
-        full_text = " ".join(clean_paras)
+        html = await http_client.fetch_text(url, timeout=FETCH_TIMEOUT)
+        full_text = " ".join(extract_paragraphs(html))
         words = full_text.split()
         summary_words = words[:200]
         return " ".join(summary_words) + ("..." if len(words) > 200 else "")
@@ -74,84 +74,125 @@ def fetch_article_summary(url: str) -> str:
         return f"Error summarizing article: {str(e)}"
 
 
-def search_dantri(query: str) -> list[str]:
+async def search_dantri(query: str) -> list[str]:
     """Search Dantri with the given query string and return up to 5 titles.
     Uses the search page https://dantri.com.vn/tim-kiem/<query>.htm.
     """
     try:
         search_url = f"https://dantri.com.vn/tim-kiem/{urllib.parse.quote_plus(query)}.htm"
         logger.debug(f"Searching Dantri for '{query}': {search_url}")
-        headers = {
-            "User-Agent": (
-                "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
-                "AppleWebKit/537.36 (KHTML, like Gecko) "
-                "Chrome/91.0.4472.124 Safari/537.36"
-            )
-        }
-        req = urllib.request.Request(search_url, headers=headers)
-        with urllib.request.urlopen(req) as response:
-            html = response.read().decode("utf-8")
-        matches = re.findall(r"<h3 class=\"article-title\">.*?<a[^>]*>(.*?)</a>", html, re.DOTALL)
-        titles: list[str] = []
-        for match in matches:
-            clean = re.sub(r"<.*?>", "", match).strip()
-            clean = (
-                clean.replace("\u0026quot;", '"')
-                .replace("\u0026apos;", "'")
-                .replace("\u0026amp;", "&")
-                .replace("\u0026lt;", "<")
-                .replace("\u0026gt;", ">")
-            )
-            if clean and clean not in titles:
-                titles.append(clean)
-            if len(titles) >= 5:
-                break
-        return titles
+        html = await http_client.fetch_text(search_url, timeout=FETCH_TIMEOUT)
+        return extract_titles(html)
     except Exception as e:
         logger.error(f"Error searching Dantri for '{query}': {e}")
         return []
 
 
-def fetch_news_with_fallback(url: str, fallback_query: str) -> list[str]:
+def _has_headlines(titles: list[str]) -> bool:
+    return bool(titles) and not titles[0].lower().startswith("error")
+
+
+async def fetch_news_with_fallback(url: str, fallback_query: str) -> list[str]:
     """Try to fetch headlines from a category URL; if none found, search.
+    If the category page is still loading after HEDGE_DELAY seconds the search
+    is started as well and the first usable result wins.
     Returns up to 5 titles.
     """
-    titles = fetch_dantri_news(url)
-    if titles and not titles[0].lower().startswith("error"):
+    primary = asyncio.create_task(fetch_dantri_news(url))
+    if HEDGE_DELAY >= 0:
+        done, _ = await asyncio.wait({primary}, timeout=HEDGE_DELAY)
+        if not done:
+            logger.info(f"{url} slower than {HEDGE_DELAY}s, hedging with search '{fallback_query}'.")
+            return await _first_headlines(primary, asyncio.create_task(search_dantri(fallback_query)))
+    titles = await primary
+    if _has_headlines(titles):
         return titles
     logger.info(f"No headlines found for {url}, falling back to search with query '{fallback_query}'.")
-    return search_dantri(fallback_query)
+    return await search_dantri(fallback_query)
+
+
+async def _first_headlines(primary: asyncio.Task, fallback: asyncio.Task) -> list[str]:
+    """Return the first usable headlines from either task, cancelling the other."""
+    pending = {primary, fallback}
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            # Prefer the category page when both finish together
+            for task in sorted(done, key=lambda t: t is not primary):
+                if _has_headlines(task.result()):
+                    return task.result()
+        return fallback.result()
+    finally:
+        for task in pending:
+            task.cancel()
 
 # MCP tools ---------------------------------------------------------------
 @mcp.tool()
-def get_world_news() -> list[str]:
+async def get_world_news() -> list[str]:
     """Return the latest 5 world‑news headlines (the‑gioi)."""
-    return fetch_news_with_fallback("https://dantri.com.vn/the-gioi.htm", "the gioi")
+    return await fetch_news_with_fallback(*CATEGORIES["the-gioi"])
 
 @mcp.tool()
-def get_vietnam_news() -> list[str]:
+async def get_vietnam_news() -> list[str]:
     """Return the latest 5 Vietnam‑news headlines (thoi‑su)."""
-    return fetch_news_with_fallback("https://dantri.com.vn/thoi-su.htm", "thoi su")
+    return await fetch_news_with_fallback(*CATEGORIES["thoi-su"])
 
 @mcp.tool()
-def get_sports_news() -> list[str]:
+async def get_sports_news() -> list[str]:
     """Return the latest 5 sports headlines (the‑thao)."""
-    return fetch_news_with_fallback("https://dantri.com.vn/the-thao.htm", "the thao")
+    return await fetch_news_with_fallback(*CATEGORIES["the-thao"])
 
 @mcp.tool()
-def get_auto_news() -> list[str]:
+async def get_auto_news() -> list[str]:
     """Return the latest 5 auto (oto, xe máy) headlines."""
-    return fetch_news_with_fallback("https://dantri.com.vn/o-to-xe-may.htm", "oto xe may")
+    return await fetch_news_with_fallback(*CATEGORIES["o-to-xe-may"])
+
+@mcp.tool()
+async def get_news_batch(categories: list[str]) -> dict:
+    """Return the latest headlines for several categories in one call, fetched concurrently.
+    Categories: the-gioi, thoi-su, the-thao, o-to-xe-may (aliases: oto-xe-may, xe).
+    Aliases of the same page are fetched once and duplicate headlines are merged.
+    """
+    pages: dict[tuple[str, str], list[str]] = {}
+    unknown: list[str] = []
+    for category in dict.fromkeys(categories):
+        page = CATEGORIES.get(category)
+        if page is None:
+            unknown.append(category)
+        else:
+            pages.setdefault(page, []).append(category)
+
+    slots = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+    async def fetch(page: tuple[str, str]) -> list[str]:
+        async with slots:
+            return await fetch_news_with_fallback(*page)
+
+    results = await asyncio.gather(*(fetch(page) for page in pages))
+    headlines: list[dict] = []
+    seen: set[str] = set()
+    for aliases, titles in zip(pages.values(), results):
+        if not _has_headlines(titles):
+            continue
+        for title in titles:
+            if title not in seen:
+                seen.add(title)
+                headlines.append({"category": aliases[0], "title": title})
+
+    result = {"success": bool(headlines), "headlines": headlines}
+    if unknown:
+        result["unknown_categories"] = unknown
+    return result
 
 @mcp.tool()
-def get_news_summary(url: str) -> str:
+async def get_news_summary(url: str) -> str:
     """Return a ~200‑word summary for the given Dantri article URL."""
-    return fetch_article_summary(url)
+    return await fetch_article_summary(url)
 
 @mcp.tool()
-def search_news(query: str) -> list[str]:
+async def search_news(query: str) -> list[str]:
     """Search Dantri for the given query and return up to 5 headlines."""
-    return search_dantri(query)
+    return await search_dantri(query)
 
 if __name__ == "__main__":
     mcp.run(transport="stdio")
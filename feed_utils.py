@@ -0,0 +1,276 @@
+# coding: utf-8
+"""
+RSS feed helpers shared by VnExpress.py and news.py.
+- iter_rss_items / parse_rss_items: streaming RSS/Atom parser that only keeps
+  title, link, description and pubDate and stops after ``limit`` items.
+- FeedCache: parsed feed items keyed by URL, with a TTL, LRU eviction and
+  ETag / Last-Modified revalidation (a 304 reply reuses the parsed items).
+  Concurrent fetches of one feed are coalesced into a single request.
+- FeedPrefetcher: optional background task that keeps every feed hot so tool
+  calls are answered from memory without waiting on the network.
+
+Env overrides:
+    RSS_CACHE_TTL    seconds a parsed feed is served without revalidation (default 300)
+    RSS_CACHE_SIZE   max number of feeds kept in memory (default 64)
+    RSS_PREFETCH     enable the background refresher (default off)
+    RSS_PREFETCH_INTERVAL      seconds between refresh rounds (default 120)
+    RSS_PREFETCH_JITTER        max random delay added to each round (default 15)
+    RSS_PREFETCH_CONCURRENCY   feeds refreshed at the same time (default 4)
+"""
+
+import asyncio
+import contextlib
+import logging
+import os
+import random
+import time
+import xml.etree.ElementTree as ET
+from collections import namedtuple
+
+import http_client
+from cache_utils import SingleFlight, TTLCache
+from html_utils import clean_text
+
+logger = logging.getLogger('FeedUtils')
+
+FEED_CACHE_TTL = float(os.getenv("RSS_CACHE_TTL", "300"))
+FEED_CACHE_SIZE = int(os.getenv("RSS_CACHE_SIZE", "64"))
+
+PREFETCH_ENABLED = os.getenv("RSS_PREFETCH", "").strip().lower() in ("1", "true", "yes", "on")
+PREFETCH_INTERVAL = float(os.getenv("RSS_PREFETCH_INTERVAL", "120"))
+PREFETCH_JITTER = float(os.getenv("RSS_PREFETCH_JITTER", "15"))
+PREFETCH_CONCURRENCY = int(os.getenv("RSS_PREFETCH_CONCURRENCY", "4"))
+
+PARSE_CHUNK_SIZE = 16 * 1024  # characters fed to the pull parser at a time
+
+# Item elements (RSS <item>, Atom <entry>) and the fields kept from them
+ITEM_TAGS = {"item", "entry"}
+FIELD_TAGS = {
+    "title": "title",
+    "link": "link",
+    "description": "description",
+    "summary": "description",
+    "pubDate": "pubDate",
+    "published": "pubDate",
+    "updated": "pubDate",
+}
+
+# items: parsed feed items (the first ones, unless complete); xml: raw feed kept
+# so a larger ``limit`` can be served without refetching;
+# etag/last_modified: validators for conditional GET
+FeedSnapshot = namedtuple("FeedSnapshot", "items complete xml etag last_modified fetched_at")
+
+
+def _local_name(tag):
+    return tag.rsplit("}", 1)[-1] if isinstance(tag, str) else ""
+
+
+def iter_rss_items(xml_text, limit=None, clean=clean_text):
+    """Yield ``{"title", "link", "description", "pubDate"}`` dicts from an RSS or Atom feed.
+
+    The document is fed to an XMLPullParser in chunks, finished items are
+    detached from the tree as soon as they are read, and parsing stops after
+    ``limit`` items. ``clean`` (default :func:`html_utils.clean_text`) is
+    applied to every field value.
+
+    An empty body yields nothing; a body cut off mid-document yields the
+    items completed before the cut. Malformed XML raises ET.ParseError.
+    """
+    if (limit is not None and limit <= 0) or not xml_text.strip():
+        return
+    parser = ET.XMLPullParser(events=("start", "end"))
+    stack = []
+    count = 0
+    for start in range(0, len(xml_text), PARSE_CHUNK_SIZE):
+        parser.feed(xml_text[start:start + PARSE_CHUNK_SIZE])
+        for event, elem in parser.read_events():
+            if event == "start":
+                stack.append(elem)
+                continue
+            stack.pop()
+            if _local_name(elem.tag) not in ITEM_TAGS:
+                continue
+            item = {}
+            for child in elem:
+                field = FIELD_TAGS.get(_local_name(child.tag))
+                if field is None or field in item:
+                    continue
+                # Atom links carry the URL in href
+                value = child.get("href") if field == "link" and child.get("href") else child.text
+                if value:
+                    item[field] = clean(value) if clean else value.strip()
+            if stack:
+                stack[-1].remove(elem)
+            elem.clear()
+            yield item
+            count += 1
+            if limit is not None and count >= limit:
+                return
+    try:
+        parser.close()
+    except ET.ParseError as e:
+        # Only reached when the input ran out (truncated download); errors
+        # inside the document are raised by feed() above
+        logger.warning(f"Feed ended early, kept the {count} complete items: {e}")
+
+
+def parse_rss_items(xml_text, limit=None, clean=clean_text):
+    """Return the first ``limit`` items of a feed (all items if ``limit`` is None)."""
+    return list(iter_rss_items(xml_text, limit=limit, clean=clean))
+
+
+class FeedCache:
+    """Cache of parsed RSS feeds, revalidated with conditional GET.
+
+    While a :class:`FeedPrefetcher` is running, ``serve_stale`` is set and
+    any cached snapshot is returned immediately; the prefetcher swaps in
+    fresh snapshots in the background.
+    """
+
+    def __init__(self, clean=clean_text, ttl=FEED_CACHE_TTL, maxsize=FEED_CACHE_SIZE):
+        self.clean = clean
+        self.cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.flight = SingleFlight()
+        self.not_modified = 0
+        self.serve_stale = False
+
+    async def get(self, url, limit=None, timeout=10):
+        """Return the first ``limit`` parsed items of ``url``, fetching only when stale."""
+        entry = self.cache.peek(url)
+        if entry is not None and (entry[1] or self.serve_stale):
+            self.cache.hits += 1
+            return self._items(url, entry[0], limit)
+        self.cache.misses += 1
+        return await self.refresh(url, limit=limit, timeout=timeout)
+
+    async def refresh(self, url, limit=None, timeout=10):
+        """Revalidate ``url`` now and store the new snapshot; return its first ``limit`` items.
+
+        Callers refreshing the same URL at the same time share one request.
+        """
+        snapshot = await self.flight.do(url, self._revalidate, url, limit, timeout)
+        return self._items(url, snapshot, limit)
+
+    async def _revalidate(self, url, limit, timeout):
+        entry = self.cache.peek(url)
+        headers = {}
+        snapshot = entry[0] if entry is not None else None
+        if snapshot is not None:
+            if snapshot.etag:
+                headers["If-None-Match"] = snapshot.etag
+            if snapshot.last_modified:
+                headers["If-Modified-Since"] = snapshot.last_modified
+
+        response = await http_client.fetch(url, headers=headers, timeout=timeout, check_status=False)
+        if response.status_code == 304 and snapshot is not None:
+            self.not_modified += 1
+            logger.debug(f"Feed not modified: {url}")
+            snapshot = snapshot._replace(fetched_at=time.time())
+            self.cache.set(url, snapshot)
+            return snapshot
+        response.raise_for_status()
+
+        xml_text = response.text
+        items = parse_rss_items(xml_text, limit=limit, clean=self.clean)
+        snapshot = FeedSnapshot(
+            items=items,
+            complete=limit is None or len(items) < limit,
+            xml=xml_text,
+            etag=response.headers.get("ETag"),
+            last_modified=response.headers.get("Last-Modified"),
+            fetched_at=time.time(),
+        )
+        self.cache.set(url, snapshot)
+        return snapshot
+
+    def _items(self, url, snapshot, limit):
+        """Serve ``limit`` items from a snapshot, parsing further into the kept XML if needed."""
+        if snapshot.complete or (limit is not None and len(snapshot.items) >= limit):
+            return snapshot.items if limit is None else snapshot.items[:limit]
+        items = parse_rss_items(snapshot.xml, limit=limit, clean=self.clean)
+        self.cache.replace(url, snapshot._replace(items=items, complete=limit is None or len(items) < limit))
+        return items
+
+    def age(self, url):
+        """Seconds since ``url`` was last fetched or revalidated (None if never)."""
+        entry = self.cache.peek(url)
+        return None if entry is None else time.time() - entry[0].fetched_at
+
+    def stats(self):
+        return {**self.cache.stats(), "not_modified": self.not_modified, "coalesced": self.flight.shared}
+
+
+class FeedPrefetcher:
+    """Refresh a set of feeds on a schedule so readers never wait on the network."""
+
+    def __init__(self, feed_cache, urls, interval=PREFETCH_INTERVAL, jitter=PREFETCH_JITTER,
+                 concurrency=PREFETCH_CONCURRENCY, enabled=PREFETCH_ENABLED):
+        self.feed_cache = feed_cache
+        self.urls = list(dict.fromkeys(urls))  # aliases share one feed URL
+        self.interval = interval
+        self.jitter = jitter
+        self.concurrency = concurrency
+        self.enabled = enabled
+        self.rounds = 0
+        self.errors = 0
+        self._task = None
+
+    @contextlib.asynccontextmanager
+    async def lifespan(self, server=None):
+        """FastMCP lifespan: run the refresher for as long as the server runs."""
+        if self.enabled:
+            self.start()
+        try:
+            yield {}
+        finally:
+            await self.stop()
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+            logger.info(f"Prefetching {len(self.urls)} feeds every ~{self.interval:.0f}s")
+
+    async def stop(self):
+        self.feed_cache.serve_stale = False
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await self.refresh_all()
+            # Only serve stale snapshots once every feed has been loaded once
+            self.feed_cache.serve_stale = all(self.feed_cache.age(url) is not None for url in self.urls)
+            await asyncio.sleep(self.interval + random.uniform(0, self.jitter))
+
+    async def refresh_all(self):
+        """Refresh every feed concurrently, bounded by ``concurrency``."""
+        limit = asyncio.Semaphore(self.concurrency)
+        lag = self.max_lag()
+        started = time.monotonic()
+
+        async def refresh(url):
+            async with limit:
+                try:
+                    await self.feed_cache.refresh(url)
+                    return True
+                except Exception as e:
+                    self.errors += 1
+                    logger.warning(f"Prefetch failed for {url}: {e}")
+                    return False
+
+        results = await asyncio.gather(*(refresh(url) for url in self.urls))
+        self.rounds += 1
+        logger.info(
+            f"Refreshed {sum(results)}/{len(self.urls)} feeds in {time.monotonic() - started:.2f}s "
+            f"(lag before refresh: {'n/a' if lag is None else f'{lag:.0f}s'})"
+        )
+
+    def max_lag(self):
+        """Age in seconds of the stalest feed, or None until all were fetched once."""
+        ages = [self.feed_cache.age(url) for url in self.urls]
+        if not ages or any(age is None for age in ages):
+            return None
+        return max(ages)
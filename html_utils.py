@@ -0,0 +1,134 @@
+# coding: utf-8
+"""
+HTML/text extraction helpers shared by the news servers.
+- clean_text: strip tags, decode entities, drop inline image URLs and
+  base64 data URIs, collapse whitespace. All patterns are compiled once.
+- extract_paragraphs: clean <p> blocks in one pass, stopping as soon as the
+  requested text budget is filled.
+- extract_headlines: (href, title, description) of the title-news links on
+  VnExpress search result pages.
+
+Micro-benchmark (per-call cost, to track regressions):
+    python html_utils.py
+"""
+
+import html
+import re
+
+_TAG_RE = re.compile(r"<[^>]+>")
+# Inline image links and base64 images left over in RSS descriptions
+_IMAGE_RE = re.compile(
+    r"https?://\S+\.(?:png|jpg|jpeg|gif|svg)\S*|data:image/[^;\s]+;base64,[A-Za-z0-9+/=]+",
+    re.IGNORECASE,
+)
+_PARAGRAPH_RE = re.compile(r"<p[^>]*>(.*?)</p>", re.DOTALL)
+_HEADLINE_RE = re.compile(
+    r'<h3[^>]*class="[^"]*title-news[^"]*"[^>]*>.*?<a[^>]*href="([^"]*)"[^>]*>(.*?)</a>', re.DOTALL
+)
+_DESCRIPTION_RE = re.compile(r'<p[^>]*class="[^"]*description[^"]*"[^>]*>(.*?)</p>', re.DOTALL)
+
+
+def clean_text(text):
+    """Return ``text`` as plain, single-spaced text without tags, entities or images."""
+    if not text:
+        return ""
+    if "<" in text:
+        text = _TAG_RE.sub("", text)
+    if "&" in text:
+        text = html.unescape(text)
+    if ":" in text:
+        text = _IMAGE_RE.sub("", text)
+    return " ".join(text.split())
+
+
+def extract_paragraphs(html_text, max_chars=None, max_count=None, min_length=1, separator="\n\n"):
+    """Return cleaned paragraph texts from ``html_text`` in document order.
+
+    Each ``<p>`` is cleaned once; paragraphs shorter than ``min_length`` are
+    skipped. Scanning stops after ``max_count`` paragraphs or as soon as the
+    texts joined with ``separator`` exceed ``max_chars``, so callers that
+    truncate to ``max_chars`` get the same result without reading the rest
+    of the page.
+    """
+    paragraphs = []
+    length = -len(separator)
+    for match in _PARAGRAPH_RE.finditer(html_text):
+        text = clean_text(match.group(1))
+        if len(text) < min_length:
+            continue
+        paragraphs.append(text)
+        length += len(separator) + len(text)
+        if max_count is not None and len(paragraphs) >= max_count:
+            break
+        if max_chars is not None and length > max_chars:
+            break
+    return paragraphs
+
+
+def extract_headlines(html_text, limit=None):
+    """Return up to ``limit`` (href, title, description) tuples of title-news links.
+
+    The description is the first ``<p class="description">`` after the
+    link's first occurrence in the page, or "" if there is none.
+    """
+    headlines = []
+    for match in _HEADLINE_RE.finditer(html_text):
+        if limit is not None and len(headlines) >= limit:
+            break
+        href = match.group(1)
+        desc_match = _DESCRIPTION_RE.search(html_text, html_text.find(href) + len(href))
+        headlines.append((href, clean_text(match.group(2)), clean_text(desc_match.group(1)) if desc_match else ""))
+    return headlines
+
+
+def _benchmark(number=20000):
+    import timeit
+
+    samples = {
+        "plain title": "Giá vàng hôm nay tăng mạnh phiên đầu tuần",
+        "entity title": "Ông Trump nói &quot;sẽ đàm phán&quot; với Trung Quốc &amp; EU",
+        "rss description": (
+            '<a href="https://vnexpress.net/gia-vang-hom-nay-4700000.html">'
+            '<img src="https://i1-vnexpress.vnecdn.net/2024/01/01/vang-1704090000.jpg?w=1200&h=0&q=100" >'
+            '</a></br>Giá vàng miếng SJC tăng 500.000 đồng mỗi lượng, lên 78,5 triệu đồng, '
+            'trong khi vàng nhẫn đi ngang &ndash; theo khảo sát sáng nay.'
+        ),
+        "article paragraph": (
+            '<p class="Normal">Theo <strong>Bộ Y tế</strong>, số ca mắc mới trong tuần giảm '
+            '12% so với tuần trước. <a href="/tag/y-te">Y tế</a> &amp; cộng đồng được khuyến cáo '
+            'tiếp tục theo dõi. <em>(Ảnh: VnExpress)</em></p>'
+        ),
+    }
+    print(f"clean_text, {number} calls each")
+    for name, text in samples.items():
+        seconds = timeit.timeit(lambda: clean_text(text), number=number)
+        print(f"  {name:<18} {seconds / number * 1e6:6.2f} us/call")
+
+    page = samples["article paragraph"] * 200
+    runs = max(number // 200, 10)
+    for max_chars in (2000, None):
+        seconds = timeit.timeit(lambda: extract_paragraphs(page, max_chars=max_chars), number=runs)
+        print(f"extract_paragraphs max_chars={max_chars}: {seconds / runs * 1e3:6.2f} ms/page")
+
+    try:
+        from feed_utils import parse_rss_items
+    except ImportError:
+        return
+    item = (
+        "<item><title><![CDATA[{title}]]></title><link>https://vnexpress.net/a-{i}.html</link>"
+        "<description><![CDATA[{description}]]></description>"
+        "<pubDate>Mon, 01 Jan 2024 10:00:00 +0700</pubDate><guid>a-{i}</guid></item>"
+    )
+    items = "".join(
+        item.format(i=i, title=samples["entity title"], description=samples["rss description"])
+        for i in range(60)
+    )
+    feed = f'<?xml version="1.0" encoding="UTF-8"?><rss version="2.0"><channel>{items}</channel></rss>'
+    for limit in (5, None):
+        seconds = timeit.timeit(lambda: parse_rss_items(feed, limit=limit), number=runs)
+        count = limit or 60
+        print(f"parse_rss_items limit={limit}: {seconds / runs * 1e6 / count:6.2f} us/item")
+
+
+if __name__ == "__main__":
+    _benchmark()
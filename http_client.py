@@ -0,0 +1,120 @@
+# coding: utf-8
+"""
+Shared async HTTP client for the MCP servers.
+- One pooled httpx.AsyncClient per event loop, so repeated tool calls reuse
+  HTTP/1.1 keep-alive connections (and HTTP/2 when the h2 package is present
+  and HTTP_CLIENT_HTTP2=1) instead of paying a TCP+TLS handshake every time.
+- Per-host concurrency limit so one slow upstream cannot take every pooled
+  connection.
+
+Env overrides:
+    HTTP_CLIENT_MAX_CONNECTIONS   total pooled connections (default 32)
+    HTTP_CLIENT_MAX_PER_HOST      concurrent requests per host (default 8)
+    HTTP_CLIENT_KEEPALIVE         idle keep-alive expiry in seconds (default 60)
+    HTTP_CLIENT_HTTP2             enable HTTP/2 when h2 is installed (default off)
+"""
+
+import asyncio
+import logging
+import os
+import urllib.parse
+
+import httpx
+
+logger = logging.getLogger('HttpClient')
+
+DEFAULT_USER_AGENT = (
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
+    "AppleWebKit/537.36 (KHTML, like Gecko) "
+    "Chrome/91.0.4472.124 Safari/537.36"
+)
+DEFAULT_TIMEOUT = 10  # seconds
+
+MAX_CONNECTIONS = int(os.getenv("HTTP_CLIENT_MAX_CONNECTIONS", "32"))
+MAX_PER_HOST = int(os.getenv("HTTP_CLIENT_MAX_PER_HOST", "8"))
+KEEPALIVE_EXPIRY = float(os.getenv("HTTP_CLIENT_KEEPALIVE", "60"))
+HTTP2 = os.getenv("HTTP_CLIENT_HTTP2", "").strip().lower() in ("1", "true", "yes", "on")
+
+# The client and host semaphores are bound to the loop that created them
+_client = None
+_client_loop = None
+_host_limits = {}
+
+
+def _http2_available():
+    if not HTTP2:
+        return False
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        logger.warning("HTTP_CLIENT_HTTP2 is set but the 'h2' package is not installed, using HTTP/1.1")
+        return False
+    return True
+
+
+def get_client():
+    """Return the shared AsyncClient for the running event loop."""
+    global _client, _client_loop, _host_limits
+    loop = asyncio.get_running_loop()
+    if _client is None or _client_loop is not loop or _client.is_closed:
+        _client = httpx.AsyncClient(
+            headers={"User-Agent": DEFAULT_USER_AGENT},
+            timeout=DEFAULT_TIMEOUT,
+            limits=httpx.Limits(
+                max_connections=MAX_CONNECTIONS,
+                max_keepalive_connections=MAX_CONNECTIONS,
+                keepalive_expiry=KEEPALIVE_EXPIRY,
+            ),
+            http2=_http2_available(),
+            follow_redirects=True,
+        )
+        _client_loop = loop
+        _host_limits = {}
+    return _client
+
+
+def _host_limit(url):
+    host = urllib.parse.urlsplit(url).netloc
+    limit = _host_limits.get(host)
+    if limit is None:
+        limit = _host_limits[host] = asyncio.Semaphore(MAX_PER_HOST)
+    return limit
+
+
+async def fetch(url, params=None, headers=None, timeout=None, check_status=True):
+    """GET ``url`` through the shared pool and return the httpx.Response.
+
+    Raises httpx.HTTPError on network failures and, unless ``check_status``
+    is false (e.g. to handle a 304 reply), on non-2xx statuses.
+    """
+    client = get_client()
+    async with _host_limit(url):
+        response = await client.get(
+            url,
+            params=params,
+            headers=headers,
+            timeout=DEFAULT_TIMEOUT if timeout is None else timeout,
+        )
+    if check_status:
+        response.raise_for_status()
+    return response
+
+
+async def fetch_text(url, params=None, headers=None, timeout=None):
+    """GET ``url`` and return the body decoded as text."""
+    response = await fetch(url, params=params, headers=headers, timeout=timeout)
+    return response.text
+
+
+async def fetch_json(url, params=None, headers=None, timeout=None):
+    """GET ``url`` and return the decoded JSON body."""
+    response = await fetch(url, params=params, headers=headers, timeout=timeout)
+    return response.json()
+
+
+async def aclose():
+    """Close the shared client (e.g. on shutdown)."""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
@@ -1,10 +1,14 @@
 # invidious_mcp.py
 from fastmcp import FastMCP
-import urllib.request
-import urllib.parse
-import json
+import asyncio
+import logging
 import sys
 import os
+import http_client
+from cache_utils import SingleFlight, TTLCache
+from job_utils import DONE, JOB_INLINE_WAIT, MAX_POLL_WAIT, JobQueue, QueueFullError
+
+logger = logging.getLogger('Invidious')
 
 # Fix UTF-8 encoding for Windows console
 if sys.platform == 'win32':
@@ -13,22 +17,84 @@ if sys.platform == 'win32':
 
 # === Cấu hình ===
 PROXY_BASE = os.getenv("INVIDIOUS_PROXY", "http://localhost:5006")
+CACHE_SIZE = int(os.getenv("INVIDIOUS_CACHE_SIZE", "256"))
+SEARCH_TTL = float(os.getenv("INVIDIOUS_SEARCH_TTL", "600"))
+VIDEO_INFO_TTL = float(os.getenv("INVIDIOUS_VIDEO_INFO_TTL", "1800"))
+TRENDING_TTL = float(os.getenv("INVIDIOUS_TRENDING_TTL", "120"))
+# Sau mỗi lần tìm kiếm, lấy trước video info của kết quả đầu tiên ở nền
+PREFETCH_TOP_HIT = os.getenv("INVIDIOUS_PREFETCH", "").strip().lower() in ("1", "true", "yes", "on")
 
 mcp = FastMCP("Invidious Music Player (via Proxy)")
 
+# Các lời gọi giống hệt nhau đang chạy cùng lúc dùng chung một request tới proxy
+proxy_flight = SingleFlight()
+
+
+async def proxy_json(path: str, params: dict | None = None, timeout: float = 10):
+    """GET JSON từ Invidious Proxy, gộp các request trùng đang chạy."""
+    key = (path, tuple(sorted((params or {}).items())))
+    return await proxy_flight.do(key, http_client.fetch_json, f"{PROXY_BASE}{path}", params=params, timeout=timeout)
+
+
+# Cache LRU + TTL cho kết quả proxy: tìm kiếm (theo query chuẩn hóa), video info (theo videoId), trending
+search_cache = TTLCache(maxsize=CACHE_SIZE, ttl=SEARCH_TTL)
+video_info_cache = TTLCache(maxsize=CACHE_SIZE, ttl=VIDEO_INFO_TTL)
+trending_cache = TTLCache(maxsize=1, ttl=TRENDING_TTL)
+_prefetch_tasks = set()
+
+
+async def cached_proxy_json(cache: TTLCache, key, path: str, params: dict | None = None, timeout: float = 10):
+    """Như proxy_json nhưng trả từ cache khi còn hạn."""
+    data = cache.get(key)
+    if data is None:
+        data = await proxy_json(path, params=params, timeout=timeout)
+        if not (isinstance(data, dict) and "error" in data):  # lỗi từ proxy không được cache
+            cache.set(key, data)
+    return data
+
+
+async def fetch_video_info(video_id: str):
+    return await cached_proxy_json(video_info_cache, video_id, "/video_info", params={"id": video_id})
+
+
+def prefetch_video_info(video_id: str):
+    """Lấy trước video info ở nền để bước "phát" sau khi tìm kiếm trả lời ngay từ cache."""
+    if not video_id or video_id in video_info_cache:
+        return
+
+    async def prefetch():
+        try:
+            await fetch_video_info(video_id)
+            logger.info(f"Prefetched video info for {video_id}")
+        except Exception as e:
+            logger.warning(f"Prefetch video info for {video_id} failed: {e}")
+
+    task = asyncio.create_task(prefetch())
+    _prefetch_tasks.add(task)
+    task.add_done_callback(_prefetch_tasks.discard)
+
+
+def invidious_cache_stats() -> dict:
+    return {
+        "search": search_cache.stats(),
+        "video_info": video_info_cache.stats(),
+        "trending": trending_cache.stats(),
+        "requests": proxy_flight.stats(),
+    }
+
 # ==========================
 # 🔍 Tìm kiếm video
 # ==========================
 @mcp.tool()
-def search_video(query: str) -> dict:
+async def search_video(query: str) -> dict:
     """Tìm kiếm video nhạc qua Invidious Proxy."""
     try:
-        url = f"{PROXY_BASE}/search?q={urllib.parse.quote_plus(query)}"
-        req = urllib.request.Request(url)
-        with urllib.request.urlopen(req, timeout=10) as response:
-            data = json.loads(response.read().decode('utf-8'))
+        key = " ".join(query.split()).casefold()
+        data = await cached_proxy_json(search_cache, key, "/search", params={"q": query}, timeout=10)
         
         if isinstance(data, list):
+            if PREFETCH_TOP_HIT and data:
+                prefetch_video_info(data[0].get("videoId"))
             results = [
                 {
                     "title": v.get("title"),
@@ -51,13 +117,10 @@ def search_video(query: str) -> dict:
 # 🎧 Lấy thông tin phát nhạc
 # ==========================
 @mcp.tool()
-def get_video_info(videoId: str) -> dict:
+async def get_video_info(videoId: str) -> dict:
     """Lấy thông tin và link phát nhạc từ proxy."""
     try:
-        url = f"{PROXY_BASE}/video_info?id={urllib.parse.quote_plus(videoId)}"
-        req = urllib.request.Request(url)
-        with urllib.request.urlopen(req, timeout=10) as response:
-            data = json.loads(response.read().decode('utf-8'))
+        data = await fetch_video_info(videoId)
 
         return {
             "success": True,
@@ -76,13 +139,10 @@ def get_video_info(videoId: str) -> dict:
 # 🚀 Lấy danh sách trending
 # ==========================
 @mcp.tool()
-def get_trending() -> dict:
+async def get_trending() -> dict:
     """Lấy danh sách video trending từ Invidious Proxy."""
     try:
-        url = f"{PROXY_BASE}/trending"
-        req = urllib.request.Request(url)
-        with urllib.request.urlopen(req, timeout=10) as response:
-            data = json.loads(response.read().decode('utf-8'))
+        data = await cached_proxy_json(trending_cache, "trending", "/trending", timeout=10)
 
         results = [
             {
@@ -103,19 +163,14 @@ def get_trending() -> dict:
 # ==========================
 # 🔊 Phát nhạc dạng PCM (ESP32)
 # ==========================
-@mcp.tool()
-def play_pcm(song: str, artist: str = "") -> dict:
-    """Tìm bài hát và lấy link stream PCM (cho ESP32 phát trực tiếp)."""
+async def resolve_pcm(song: str, artist: str = "") -> dict:
+    """Gọi proxy chuẩn bị luồng PCM (có thể mất tới 60 giây)."""
     try:
         params = {"song": song}
         if artist:
             params["artist"] = artist
-        query_string = urllib.parse.urlencode(params)
-        url = f"{PROXY_BASE}/stream_pcm?{query_string}"
         
-        req = urllib.request.Request(url)
-        with urllib.request.urlopen(req, timeout=60) as response:
-            data = json.loads(response.read().decode('utf-8'))
+        data = await proxy_json("/stream_pcm", params=params, timeout=60)
         
         if "audio_url" not in data:
             return {"success": False, "message": "Không tìm thấy bài hát hoặc không có luồng PCM."}
@@ -132,17 +187,50 @@ def play_pcm(song: str, artist: str = "") -> dict:
         return {"success": False, "message": f"Lỗi phát PCM: {e}"}
 
 
+# Chuẩn bị PCM chạy nền: hàng đợi giới hạn, mỗi job có deadline
+pcm_jobs = JobQueue("Invidious PCM")
+
+
+def pcm_job_response(job) -> dict:
+    if job.status == DONE:
+        return job.result
+    info = job.to_dict()
+    if job.error is None:
+        return {"success": True, "pending": True, **info,
+                "message": "Đang chuẩn bị luồng PCM, gọi get_pcm_job_status(job_id) để lấy audio_url."}
+    return {"success": False, **info, "message": f"Lỗi phát PCM: {job.error}"}
+
+
+@mcp.tool()
+async def play_pcm(song: str, artist: str = "") -> dict:
+    """Tìm bài hát và lấy link stream PCM (cho ESP32 phát trực tiếp).
+    Nếu proxy cần chuẩn bị lâu, trả về job_id (pending=true); gọi get_pcm_job_status(job_id) để lấy audio_url."""
+    try:
+        job = pcm_jobs.submit(("pcm", song.casefold(), artist.casefold()), resolve_pcm, song, artist)
+    except QueueFullError:
+        return {"success": False, "message": "Đang có quá nhiều yêu cầu phát nhạc, vui lòng thử lại sau."}
+    await pcm_jobs.wait(job, JOB_INLINE_WAIT)
+    return pcm_job_response(job)
+
+
+@mcp.tool()
+async def get_pcm_job_status(job_id: str, wait: float = 0) -> dict:
+    """Kiểm tra job play_pcm; chờ tối đa `wait` giây (<= 25) nếu job chưa xong. Khi xong trả về audio_url."""
+    job = pcm_jobs.get(job_id)
+    if job is None:
+        return {"success": False, "message": f"Không tìm thấy job {job_id} (có thể đã hết hạn)."}
+    await pcm_jobs.wait(job, min(max(wait, 0), MAX_POLL_WAIT))
+    return pcm_job_response(job)
+
+
 # ==========================
 # 🩺 Kiểm tra tình trạng proxy
 # ==========================
 @mcp.tool()
-def health_check() -> dict:
+async def health_check() -> dict:
     """Kiểm tra tình trạng hoạt động của Invidious Proxy."""
     try:
-        url = f"{PROXY_BASE}/health"
-        req = urllib.request.Request(url)
-        with urllib.request.urlopen(req, timeout=5) as response:
-            data = json.loads(response.read().decode('utf-8'))
+        data = await proxy_json("/health", timeout=5)
         return {"success": True, "proxy_status": data}
     except Exception as e:
         return {"success": False, "message": f"Lỗi khi kiểm tra: {e}"}
@@ -0,0 +1,180 @@
+# coding: utf-8
+"""
+Background job queue for slow tool calls (PCM transcodes, stream resolution).
+- JobQueue: bounded asyncio queue drained by a fixed number of workers; each
+  job gets a deadline counted from submission and identical requests share
+  one job. Finished jobs are kept for a while so clients can poll them.
+
+Env overrides:
+    JOB_WORKERS       jobs resolved at the same time per server (default 2)
+    JOB_QUEUE_SIZE    jobs waiting before new ones are refused (default 16)
+    JOB_DEADLINE      seconds a job may take, queueing included (default 90)
+    JOB_INLINE_WAIT   seconds a tool call waits before answering with a job id (default 5)
+    JOB_RESULT_TTL    seconds finished jobs stay available for polling (default 600)
+"""
+
+import asyncio
+import contextlib
+import functools
+import logging
+import os
+import time
+import uuid
+
+from cache_utils import TTLCache
+
+logger = logging.getLogger('JobQueue')
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_QUEUE_SIZE = int(os.getenv("JOB_QUEUE_SIZE", "16"))
+JOB_DEADLINE = float(os.getenv("JOB_DEADLINE", "90"))
+JOB_INLINE_WAIT = float(os.getenv("JOB_INLINE_WAIT", "5"))
+JOB_RESULT_TTL = float(os.getenv("JOB_RESULT_TTL", "600"))
+
+MAX_POLL_WAIT = 25  # seconds a status call may block waiting for a job
+
+# Job states
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+EXPIRED = "expired"
+
+
+class QueueFullError(Exception):
+    """Raised by JobQueue.submit when the queue cannot take another job."""
+
+
+class Job:
+    def __init__(self, key, call, deadline):
+        self.id = uuid.uuid4().hex[:12]
+        self.key = key
+        self.call = call
+        self.status = QUEUED
+        self.result = None
+        self.error = None
+        self.submitted = time.monotonic()
+        self.deadline = self.submitted + deadline
+        self.finished = None
+        self.done = asyncio.Event()
+
+    def to_dict(self):
+        end = self.finished or time.monotonic()
+        info = {"job_id": self.id, "status": self.status, "elapsed": round(end - self.submitted, 1)}
+        if self.error is not None:
+            info["error"] = self.error
+        return info
+
+
+class JobQueue:
+    """Run slow coroutines in the background under a bounded queue.
+
+    ``submit`` returns immediately with a :class:`Job`; ``wait`` blocks for
+    up to a timeout; ``get`` looks a job up by id for status polling.
+    """
+
+    def __init__(self, name, workers=JOB_WORKERS, maxsize=JOB_QUEUE_SIZE,
+                 deadline=JOB_DEADLINE, keep=JOB_RESULT_TTL):
+        self.name = name
+        self.workers = workers
+        self.maxsize = maxsize
+        self.deadline = deadline
+        self.jobs = TTLCache(maxsize=max(4 * (maxsize + workers), 64), ttl=keep)
+        self.completed = 0
+        self.failed = 0
+        self.expired = 0
+        self.rejected = 0
+        self._active = {}  # key -> queued or running Job
+        self._queue = None
+        self._loop = None
+        self._tasks = []
+
+    def submit(self, key, func, *args, deadline=None, **kwargs):
+        """Queue ``func(*args, **kwargs)`` unless an identical job (same ``key``) is pending.
+
+        Raises QueueFullError when ``maxsize`` jobs are already waiting.
+        """
+        job = self._active.get(key)
+        if job is not None:
+            return job
+        self._ensure_workers()
+        job = Job(key, functools.partial(func, *args, **kwargs), self.deadline if deadline is None else deadline)
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            self.rejected += 1
+            raise QueueFullError(f"{self.name}: {self.maxsize} jobs already queued") from None
+        self._active[key] = job
+        self.jobs.set(job.id, job)
+        logger.info(f"{self.name}: queued job {job.id} ({self._queue.qsize()} waiting)")
+        return job
+
+    def get(self, job_id):
+        return self.jobs.get(job_id)
+
+    async def wait(self, job, timeout):
+        """Wait up to ``timeout`` seconds for ``job`` to finish and return it."""
+        if timeout > 0 and not job.done.is_set():
+            with contextlib.suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(job.done.wait(), timeout)
+        return job
+
+    def _ensure_workers(self):
+        loop = asyncio.get_running_loop()
+        if self._queue is not None and self._loop is loop:
+            return
+        self._queue = asyncio.Queue(maxsize=self.maxsize)
+        self._loop = loop
+        self._active = {}
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            try:
+                await self._run(job)
+            finally:
+                if self._active.get(job.key) is job:
+                    del self._active[job.key]
+                job.finished = time.monotonic()
+                self.jobs.set(job.id, job)  # keep finished jobs for JOB_RESULT_TTL from now
+                job.done.set()
+                self._queue.task_done()
+
+    async def _run(self, job):
+        remaining = job.deadline - time.monotonic()
+        if remaining <= 0:
+            job.status, job.error = EXPIRED, "deadline exceeded while queued"
+            self.expired += 1
+            return
+        job.status = RUNNING
+        try:
+            job.result = await asyncio.wait_for(job.call(), remaining)
+            job.status = DONE
+            self.completed += 1
+        except asyncio.TimeoutError:
+            job.status, job.error = EXPIRED, "deadline exceeded"
+            self.expired += 1
+        except Exception as e:
+            job.status, job.error = FAILED, str(e)
+            self.failed += 1
+        logger.info(f"{self.name}: job {job.id} {job.status} in {time.monotonic() - job.submitted:.1f}s")
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            with contextlib.suppress(asyncio.CancelledError):
+                await task
+        self._tasks = []
+        self._queue = None
+
+    def stats(self):
+        return {
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "active": len(self._active),
+            "completed": self.completed,
+            "failed": self.failed,
+            "expired": self.expired,
+            "rejected": self.rejected,
+        }
@@ -13,22 +13,49 @@ Run all configured servers (default)
 Run a single local server script (back-compat)
     python mcp_pipe.py path/to/server.py
 
+Run all configured servers behind one WebSocket (multiplexer)
+    MCP_MULTIPLEX=1 python mcp_pipe.py
+    # or set "multiplex": true at the top level of mcp_config.json
+
 Config discovery order:
     $MCP_CONFIG, then ./mcp_config.json
 
 Env overrides:
     (none for proxy; uses current Python: python -m mcp_proxy)
+    MCP_MULTIPLEX=1  share one upstream connection between all servers
+    MCP_METRICS_PORT / MCP_METRICS_HOST  local HTTP endpoint for /metrics, /healthz
+                     and /readyz (default 127.0.0.1:9464, port 0 disables; see pipe_metrics.py)
+    MCP_HEALTH_GRACE seconds every connection may stay down before /healthz fails (default 300)
+    MCP_HEALTHY_SESSION  seconds a session must last to reset the reconnect backoff (default 60)
+    MCP_BACKPRESSURE_BACKOFF  base wait after close code 4004 / HTTP 429 (default 30)
+    MCP_CONNECT_RATE / MCP_CONNECT_BURST  connection attempts per second per endpoint
+                     host, shared by all servers (default 0.2, burst 5; rate 0 disables)
+    MCP_RESTART_LIMIT / MCP_RESTART_WINDOW  crashed servers are restarted at most
+                     LIMIT times per WINDOW seconds (default 5 per 300)
+
+In-process servers ("type": "inprocess") import the module named by "module"
+(or the .py path in "args") and serve its FastMCP object ("object", default
+"mcp") on the pipe's own event loop instead of spawning an interpreter. They
+share the pipe's environment, so they cannot have an "env" of their own.
 """
 
 import asyncio
 import websockets
-import subprocess
 import logging
 import os
 import signal
 import sys
 import json
+import random
+import time
+import urllib.parse
+import itertools
+import importlib
+import importlib.util
+import contextlib
+from collections import deque
 from dotenv import load_dotenv
+from pipe_metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, metrics, serve_http
 
 # Auto-load environment variables from a .env file if present
 load_dotenv()
@@ -40,135 +67,951 @@ logging.basicConfig(
 )
 logger = logging.getLogger('MCP_PIPE')
 
+PIPE_VERSION = "0.2.0"
+
 # Reconnection settings
 INITIAL_BACKOFF = 1  # Initial wait time in seconds
 MAX_BACKOFF = 600  # Maximum wait time in seconds
+HEALTHY_SESSION = float(os.environ.get("MCP_HEALTHY_SESSION", "60"))  # Session length that resets the backoff
+BACKPRESSURE_BACKOFF = float(os.environ.get("MCP_BACKPRESSURE_BACKOFF", "30"))  # Base wait when the endpoint is full
+BACKPRESSURE_CLOSE_CODES = {4004}  # xiaozhi.me closes with 4004 when a token has too many connections
+CONNECT_RATE = float(os.environ.get("MCP_CONNECT_RATE", "0.2"))  # Connection attempts/second per endpoint host
+CONNECT_BURST = int(os.environ.get("MCP_CONNECT_BURST", "5"))
+
+# Child process pipes
+STREAM_LIMIT = 16 * 1024 * 1024  # Max bytes per JSON-RPC line read from a child
+
+# Crash supervision
+RESTART_LIMIT = int(os.environ.get("MCP_RESTART_LIMIT", "5"))  # Restarts allowed per window
+RESTART_WINDOW = float(os.environ.get("MCP_RESTART_WINDOW", "300"))  # Seconds
+RESTART_DELAY = 1  # Seconds before restarting a crashed server
+
+# Multiplexer settings
+MULTIPLEX_LABEL = "multiplex"  # Log label for the shared connection
+CHILD_REQUEST_TIMEOUT = 30  # Seconds to wait for a child during initialize/tools/list fan-out
+TOOL_NAMESPACE_SEPARATOR = "__"  # Colliding tools are exposed as <server>__<tool>
+
+# Health endpoint settings
+HEALTH_GRACE = float(os.environ.get("MCP_HEALTH_GRACE", "300"))  # Seconds all connections may be down
+
+STARTED_AT = time.monotonic()
+
+class ConnectionStatus:
+    """Health view of one upstream connection, kept across reconnects."""
+
+    def __init__(self, label):
+        self.label = label
+        self.state = "starting"  # starting, connecting, connected, backoff
+        self.since = time.monotonic()
+        self.last_up = None  # when the connection was last seen open
+        self.connected_at = None  # when the current or last session opened
+        self.backpressure = False  # the last session ended with a back-pressure signal
+        self.last_message = None
+        self.attempt = 0
+        self.retry_at = None
+        self.last_error = None
+
+    def set_state(self, state):
+        now = time.monotonic()
+        if self.state == "connected" or state == "connected":
+            self.last_up = now
+        if state == "connected":
+            self.connected_at = now
+        self.state = state
+        self.since = now
+        if state != "backoff":
+            self.retry_at = None
+
+    def down_for(self, now):
+        """Seconds since the connection was last open (or since start), 0 while connected."""
+        if self.state == "connected":
+            return 0
+        return now - (self.last_up or STARTED_AT)
+
+    def to_dict(self, now):
+        info = {
+            "name": self.label,
+            "state": self.state,
+            "state_for": round(now - self.since, 1),
+            "reconnect_attempt": self.attempt,
+            "last_message_ago": None if self.last_message is None else round(now - self.last_message, 1),
+        }
+        if self.retry_at is not None:
+            info["retry_in"] = round(max(self.retry_at - now, 0), 1)
+        if self.last_error:
+            info["last_error"] = self.last_error
+        if self.backpressure:
+            info["backpressure"] = True
+        return info
+
+class TokenBucket:
+    """Rate limit for connection attempts to one endpoint, shared by every server using it.
+
+    ``hold`` closes the bucket for a while, so a back-pressure signal seen by
+    one server also delays the others instead of letting them pile on.
+    """
+
+    def __init__(self, rate=CONNECT_RATE, burst=CONNECT_BURST):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        """Wait for a connection token; waiting servers take turns in order."""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if self.rate > 0:
+                    self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                wait = self.blocked_until - now
+                if wait <= 0:
+                    if self.rate <= 0 or self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    wait = (1 - self.tokens) / self.rate
+                await asyncio.sleep(wait)
+
+    def hold(self, seconds):
+        """Refuse new attempts for ``seconds``."""
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+_endpoint_buckets = {}
+
+def endpoint_bucket(uri):
+    """Return the TokenBucket shared by every connection to ``uri``'s host."""
+    parts = urllib.parse.urlsplit(uri)
+    key = f"{parts.scheme}://{parts.netloc}"
+    bucket = _endpoint_buckets.get(key)
+    if bucket is None:
+        bucket = _endpoint_buckets[key] = TokenBucket()
+    return bucket
+
+def is_backpressure(error):
+    """True when the endpoint refused us for load: close code 4004 or HTTP 429."""
+    code = getattr(getattr(error, "rcvd", None), "code", None)
+    if code in BACKPRESSURE_CLOSE_CODES:
+        return True
+    response = getattr(error, "response", None)
+    return getattr(response, "status_code", getattr(error, "status_code", None)) == 429
 
-async def connect_with_retry(uri, target):
-    """Connect to WebSocket server with retry mechanism for a given server target."""
+class ReconnectScheduler:
+    """Delays between connection attempts of one upstream connection.
+
+    Ordinary failures use exponential backoff with full jitter (a random wait
+    between 0 and the current cap), so servers that dropped together do not
+    retry in lockstep. A session that stayed up for HEALTHY_SESSION seconds
+    resets the backoff, so a late flap recovers in about a second. Back-pressure
+    (4004, HTTP 429) backs off separately, from BACKPRESSURE_BACKOFF upwards,
+    and holds the shared endpoint bucket so the other servers wait as well.
+    """
+
+    def __init__(self, uri):
+        self.bucket = endpoint_bucket(uri)
+        self.failures = 0
+        self.backpressure = 0
+
+    def next_delay(self, session_length, error):
+        """Record how a session ended and return the wait before the next attempt."""
+        if session_length >= HEALTHY_SESSION:
+            self.failures = 0
+            self.backpressure = 0
+        if is_backpressure(error):
+            self.backpressure += 1
+            cap = min(BACKPRESSURE_BACKOFF * 2 ** (self.backpressure - 1), MAX_BACKOFF)
+            delay = random.uniform(cap / 2, cap)  # never retry a full endpoint right away
+            self.bucket.hold(delay)
+            return delay
+        self.failures += 1
+        return random.uniform(0, min(INITIAL_BACKOFF * 2 ** (self.failures - 1), MAX_BACKOFF))
+
+async def connect_with_retry(uri, target, connect, status=None):
+    """Connect to WebSocket server with retry mechanism for a given server target.
+
+    ``connect(uri, target)`` serves one connection; it is normally
+    :meth:`Multiplexer.connect`, whose server processes survive reconnects.
+    ``status`` (a :class:`ConnectionStatus`) is kept up to date for /healthz.
+    Waits between attempts come from a :class:`ReconnectScheduler`.
+    """
+    status = status or ConnectionStatus(target)
+    scheduler = ReconnectScheduler(uri)
     reconnect_attempt = 0
-    backoff = INITIAL_BACKOFF
+    delay = 0
     while True:  # Infinite reconnection
+        started = None
         try:
-            if reconnect_attempt > 0:
-                logger.info(f"[{target}] Waiting {backoff}s before reconnection attempt {reconnect_attempt}...")
-                await asyncio.sleep(backoff)
+            if delay > 0:
+                logger.info(f"[{target}] Waiting {delay:.1f}s before reconnection attempt {reconnect_attempt}...")
+                status.set_state("backoff")
+                status.retry_at = time.monotonic() + delay
+                await asyncio.sleep(delay)
 
-            # Attempt to connect
-            await connect_to_server(uri, target)
+            # Attempt to connect, within the endpoint's shared rate budget
+            status.set_state("connecting")
+            await scheduler.bucket.acquire()
+            started = time.monotonic()
+            await connect(uri, target)
 
         except Exception as e:
+            opened = status.connected_at if started is not None and (status.connected_at or 0) >= started else None
+            session_length = time.monotonic() - opened if opened is not None else 0
+            if session_length >= HEALTHY_SESSION:
+                reconnect_attempt = 0
             reconnect_attempt += 1
-            logger.warning(f"[{target}] Connection closed (attempt {reconnect_attempt}): {e}")
-            # Calculate wait time for next reconnection (exponential backoff)
-            backoff = min(backoff * 2, MAX_BACKOFF)
+            status.attempt = reconnect_attempt
+            status.last_error = str(e) or type(e).__name__
+            status.backpressure = is_backpressure(e)
+            metrics.reconnects.inc(target)
+            if status.backpressure:
+                metrics.backpressure.inc(target)
+                logger.warning(f"[{target}] Endpoint is over its connection limit (attempt {reconnect_attempt}): {e}")
+            else:
+                logger.warning(f"[{target}] Connection closed (attempt {reconnect_attempt}): {e}")
+            delay = scheduler.next_delay(session_length, e)
 
-async def connect_to_server(uri, target):
-    """Connect to WebSocket server and pipe stdio for the given server target."""
-    try:
-        logger.info(f"[{target}] Connecting to WebSocket server...")
-        async with websockets.connect(uri) as websocket:
-            logger.info(f"[{target}] Successfully connected to WebSocket server")
-
-            # Start server process (built from CLI arg or config)
-            cmd, env = build_server_command(target)
-            process = subprocess.Popen(
-                cmd,
-                stdin=subprocess.PIPE,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                encoding='utf-8',
-                text=True,
-                env=env
-            )
-            logger.info(f"[{target}] Started server process: {' '.join(cmd)}")
-            
-            # Create two tasks: read from WebSocket and write to process, read from process and write to WebSocket
-            await asyncio.gather(
-                pipe_websocket_to_process(websocket, process, target),
-                pipe_process_to_websocket(process, websocket, target),
-                pipe_process_stderr_to_terminal(process, target)
-            )
-    except websockets.exceptions.ConnectionClosed as e:
-        logger.error(f"[{target}] WebSocket connection closed: {e}")
-        raise  # Re-throw exception to trigger reconnection
-    except Exception as e:
-        logger.error(f"[{target}] Connection error: {e}")
-        raise  # Re-throw exception
-    finally:
-        # Ensure the child process is properly terminated
-        if 'process' in locals():
-            logger.info(f"[{target}] Terminating server process")
-            try:
-                process.terminate()
-                process.wait(timeout=5)
-            except subprocess.TimeoutExpired:
-                process.kill()
-            logger.info(f"[{target}] Server process terminated")
-
-async def pipe_websocket_to_process(websocket, process, target):
-    """Read data from WebSocket and write to process stdin"""
-    try:
-        while True:
-            # Read message from WebSocket
-            message = await websocket.recv()
-            logger.debug(f"[{target}] << {message[:120]}...")
-            
-            # Write to process stdin (in text mode)
-            if isinstance(message, bytes):
-                message = message.decode('utf-8')
-            process.stdin.write(message + '\n')
-            process.stdin.flush()
-    except Exception as e:
-        logger.error(f"[{target}] Error in WebSocket to process pipe: {e}")
-        raise  # Re-throw exception to trigger reconnection
-    finally:
-        # Close process stdin
-        if not process.stdin.closed:
-            process.stdin.close()
+async def start_server_process(target):
+    """Spawn the server for ``target`` with non-blocking asyncio pipes."""
+    cmd, env = build_server_command(target)
+    process = await asyncio.create_subprocess_exec(
+        *cmd,
+        stdin=asyncio.subprocess.PIPE,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+        env=env,
+        limit=STREAM_LIMIT
+    )
+    logger.info(f"[{target}] Started server process: {' '.join(cmd)}")
+    return process
 
-async def pipe_process_to_websocket(process, websocket, target):
-    """Read data from process stdout and send to WebSocket"""
+async def terminate_process(process, target):
+    """Terminate ``process``, escalating to kill after a grace period."""
+    if process.returncode is not None:
+        return
+    logger.info(f"[{target}] Terminating server process")
     try:
-        while True:
-            # Read data from process stdout
-            data = await asyncio.to_thread(process.stdout.readline)
-            
-            if not data:  # If no data, the process may have ended
-                logger.info(f"[{target}] Process has ended output")
-                break
-                
-            # Send data to WebSocket
-            logger.debug(f"[{target}] >> {data[:120]}...")
-            # In text mode, data is already a string, no need to decode
-            await websocket.send(data)
-    except Exception as e:
-        logger.error(f"[{target}] Error in process to WebSocket pipe: {e}")
-        raise  # Re-throw exception to trigger reconnection
+        process.terminate()
+        await asyncio.wait_for(process.wait(), timeout=5)
+    except asyncio.TimeoutError:
+        process.kill()
+        await process.wait()
+    except ProcessLookupError:
+        pass
+    logger.info(f"[{target}] Server process terminated")
+
+async def write_line(process, message, target):
+    """Write one line to the process stdin, waiting on the pipe's backpressure."""
+    if process.stdin.is_closing():
+        raise ConnectionResetError(f"[{target}] Process stdin is closed")
+    process.stdin.write((message + '\n').encode('utf-8'))
+    await process.stdin.drain()
+
+def jsonrpc_error(msg_id, code, message):
+    """Build a JSON-RPC error response."""
+    return {"jsonrpc": "2.0", "id": msg_id, "error": {"code": code, "message": message}}
 
 async def pipe_process_stderr_to_terminal(process, target):
     """Read data from process stderr and print to terminal"""
     try:
         while True:
             # Read data from process stderr
-            data = await asyncio.to_thread(process.stderr.readline)
+            data = await process.stderr.readline()
             
             if not data:  # If no data, the process may have ended
                 logger.info(f"[{target}] Process has ended stderr output")
                 break
                 
-            # Print stderr data to terminal (in text mode, data is already a string)
-            sys.stderr.write(data)
+            # Print stderr data to terminal
+            sys.stderr.write(data.decode('utf-8', errors='replace'))
             sys.stderr.flush()
     except Exception as e:
         logger.error(f"[{target}] Error in process stderr pipe: {e}")
         raise  # Re-throw exception to trigger reconnection
 
+class ServerChild:
+    """One long-lived stdio MCP server process.
+
+    The process outlives WebSocket sessions: the pipe performs the MCP
+    handshake once, caches the ``initialize`` and ``tools/list`` results and
+    replays them when the upstream reconnects. Requests sent through
+    :meth:`request` get a pipe-local JSON-RPC id so that responses from
+    different children never clash; everything else the child prints
+    (notifications) goes to ``sink``, or is dropped while disconnected.
+
+    If the server exits on its own, requests waiting on it are failed right
+    away and a supervisor restarts it (at most RESTART_LIMIT times per
+    RESTART_WINDOW) and replays the handshake, while the WebSocket stays open.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.process = None
+        self.pending = {}  # local id -> Future
+        self.sink = None  # async callable(child, message) of the current session
+        self.init_result = None  # cached initialize result
+        self.tools_result = None  # cached tools/list result
+        self.last_message = None  # monotonic time of the last line from the server
+        self.init_params = None  # upstream initialize params, replayed after a restart
+        self.restarts = deque()  # monotonic times of recent restarts
+        self.gave_up = False  # restart budget exhausted
+        self._ids = itertools.count(1)
+        self._tasks = []
+        self._supervisor = None
+        self._stopping = False
+        self._eof = False  # output ended; the process is exiting even if not reaped yet
+        self._start_lock = asyncio.Lock()
+        self._init_lock = asyncio.Lock()
+
+    @property
+    def alive(self):
+        return self.process is not None and self.process.returncode is None and not self._eof
+
+    @property
+    def ready(self):
+        return self.alive and self.init_result is not None
+
+    @property
+    def restarting(self):
+        return self._supervisor is not None and not self._supervisor.done()
+
+    @property
+    def pid(self):
+        return self.process.pid if self.process is not None else None
+
+    def pid_alive(self):
+        """Check the OS process itself, not only the exit status asyncio has seen."""
+        if not self.alive:
+            return False
+        try:
+            os.kill(self.process.pid, 0)
+        except ProcessLookupError:
+            return False
+        except OSError:
+            pass  # exists, but owned by someone else
+        return True
+
+    def to_dict(self, now):
+        return {
+            "name": self.name,
+            "pid": self.pid,
+            "alive": self.pid_alive(),
+            "ready": self.ready,
+            "restarting": self.restarting,
+            "recent_restarts": len(self.restarts),
+            "gave_up": self.gave_up,
+            "pending_requests": len(self.pending),
+            "last_message_ago": None if self.last_message is None else round(now - self.last_message, 1),
+        }
+
+    async def ensure_started(self):
+        """Start the process unless it is already running."""
+        async with self._start_lock:
+            if self.alive:
+                return
+            if self.gave_up:
+                raise RuntimeError(f"Server '{self.name}' crashed too often and was not restarted")
+            self.init_result = None
+            self.tools_result = None
+            self._eof = False
+            self._tasks = await self._spawn()
+            self._tasks.append(asyncio.create_task(self.read_loop()))
+
+    async def stop(self):
+        self._stopping = True
+        if self._supervisor is not None:
+            self._supervisor.cancel()
+        if self.process is None:
+            return
+        await self._terminate()
+        for task in self._tasks:
+            task.cancel()
+        self._fail_pending(f"Server '{self.name}' stopped")
+
+    # Transport hooks, overridden by InProcessChild
+
+    async def _spawn(self):
+        """Start the server; return helper tasks owned by this child."""
+        self.process = await start_server_process(self.name)
+        return [asyncio.create_task(pipe_process_stderr_to_terminal(self.process, self.name))]
+
+    async def _terminate(self):
+        await terminate_process(self.process, self.name)
+
+    async def _wait_exit(self):
+        """Wait for the server to exit and return its exit code."""
+        return await self.process.wait()
+
+    async def _readline(self):
+        """Return the next line written by the server, or "" at EOF."""
+        return (await self.process.stdout.readline()).decode('utf-8', errors='replace')
+
+    async def _write(self, data):
+        await write_line(self.process, data, self.name)
+
+    async def initialize(self, params):
+        """Run the MCP handshake once per process and replay it afterwards."""
+        await self.ensure_started()
+        async with self._init_lock:
+            if self.init_result is not None:
+                logger.info(f"[{self.name}] Replaying cached initialize result")
+                return self.init_result
+            response = await self.request(
+                {"jsonrpc": "2.0", "method": "initialize", "params": params},
+                timeout=CHILD_REQUEST_TIMEOUT
+            )
+            if "error" in response:
+                raise RuntimeError(response["error"].get("message"))
+            await self.send({"jsonrpc": "2.0", "method": "notifications/initialized"})
+            self.init_params = params
+            self.init_result = response.get("result") or {}
+            logger.info(f"[{self.name}] Initialized ({(self.init_result.get('serverInfo') or {}).get('name', '?')})")
+            return self.init_result
+
+    async def list_tools(self):
+        """Return the child's tools/list result, cached until it reports a change."""
+        if self.tools_result is None:
+            response = await self.request(
+                {"jsonrpc": "2.0", "method": "tools/list", "params": {}},
+                timeout=CHILD_REQUEST_TIMEOUT
+            )
+            if "error" in response:
+                raise RuntimeError(response["error"].get("message"))
+            self.tools_result = response.get("result") or {}
+        return self.tools_result
+
+    async def send(self, message):
+        """Write one JSON-RPC message to the child's stdin."""
+        data = json.dumps(message, ensure_ascii=False)
+        logger.debug(f"[{self.name}] << {data[:120]}...")
+        metrics.message("child", self.name, "out", data)
+        await self._write(data)
+
+    async def request(self, message, timeout=None):
+        """Send a request under a local id and wait for the child's response."""
+        local_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        self.pending[local_id] = future
+        try:
+            await self.send({**message, "id": local_id})
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.CancelledError:
+            if self.alive:
+                await self.send({
+                    "jsonrpc": "2.0",
+                    "method": "notifications/cancelled",
+                    "params": {"requestId": local_id, "reason": "Cancelled upstream"},
+                })
+            raise
+        finally:
+            self.pending.pop(local_id, None)
+
+    async def read_loop(self):
+        """Dispatch child stdout: resolve pending requests, forward the rest."""
+        while True:
+            try:
+                data = await self._readline()
+            except Exception as e:
+                # e.g. a line longer than STREAM_LIMIT: the stream cannot be
+                # resynchronised, so stop the server and handle it like an exit
+                logger.error(f"[{self.name}] Unreadable server output, stopping it: {e!r}")
+                await self._terminate()
+                data = ""
+            if not data:
+                logger.info(f"[{self.name}] Process has ended output")
+                self._eof = True
+                self._fail_pending(f"Server '{self.name}' exited before answering")
+                if not self._stopping and not self.restarting:
+                    self._supervisor = asyncio.create_task(self.supervise())
+                break
+            logger.debug(f"[{self.name}] >> {data[:120]}...")
+            metrics.message("child", self.name, "in", data)
+            self.last_message = time.monotonic()
+            try:
+                message = json.loads(data)
+            except json.JSONDecodeError:
+                logger.debug(f"[{self.name}] Ignoring non JSON-RPC output")
+                continue
+            if not isinstance(message, dict):
+                continue
+            if "method" not in message and message.get("id") in self.pending:
+                future = self.pending.pop(message["id"])
+                if not future.done():
+                    future.set_result(message)
+            elif "method" in message and "id" in message and self.sink is None:
+                # Server-to-client request (sampling, roots, ...) with no
+                # upstream session to answer it
+                await self.send(jsonrpc_error(message["id"], -32601, "Not supported by mcp_pipe"))
+            else:
+                if message.get("method") == "notifications/tools/list_changed":
+                    self.tools_result = None
+                if self.sink is not None:
+                    await self.sink(self, message)
+
+    async def supervise(self):
+        """Restart the server after it exited on its own, within the restart budget."""
+        previous_tools = self.tools_result
+        exited = True  # False after the pipe itself stopped a failed restart
+        while not self._stopping:
+            if self.process is not None and exited:
+                code = await self._wait_exit()
+                logger.warning(f"[{self.name}] Server exited unexpectedly (exit code {code})")
+            exited = True
+            now = time.monotonic()
+            while self.restarts and now - self.restarts[0] > RESTART_WINDOW:
+                self.restarts.popleft()
+            if len(self.restarts) >= RESTART_LIMIT:
+                self.gave_up = True
+                logger.error(f"[{self.name}] Restarted {len(self.restarts)} times in {RESTART_WINDOW:g}s, giving up")
+                return
+            self.restarts.append(now)
+            metrics.child_restarts.inc(self.name)
+            logger.info(f"[{self.name}] Restarting in {RESTART_DELAY}s ({len(self.restarts)}/{RESTART_LIMIT} in {RESTART_WINDOW:g}s)")
+            await asyncio.sleep(RESTART_DELAY)
+            try:
+                await self.ensure_started()
+                if self.init_params is not None:
+                    await self.initialize(self.init_params)
+                    tools = await self.list_tools()
+                    if previous_tools is not None and tools != previous_tools and self.sink is not None:
+                        await self.sink(self, {"jsonrpc": "2.0", "method": "notifications/tools/list_changed"})
+            except Exception as e:
+                # A server that started but never answered the handshake counts
+                # as a failed restart; stop it so the next attempt starts clean
+                logger.error(f"[{self.name}] Restart failed: {e!r}")
+                if self.process is not None:
+                    await self._terminate()
+                exited = False
+                continue
+            logger.info(f"[{self.name}] Server restarted")
+            return
+
+    def _fail_pending(self, reason):
+        for future in self.pending.values():
+            if not future.done():
+                future.set_exception(RuntimeError(reason))
+        self.pending.clear()
+
+class _QueueLineReader:
+    """Async line iterator fed from an asyncio.Queue; ``None`` marks EOF."""
+
+    def __init__(self, queue):
+        self.queue = queue
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        line = await self.queue.get()
+        if line is None:
+            raise StopAsyncIteration
+        return line
+
+class _QueueLineWriter:
+    """Minimal async text file that pushes complete lines onto a queue."""
+
+    def __init__(self, queue):
+        self.queue = queue
+        self._buffer = ""
+
+    async def write(self, data):
+        self._buffer += data
+        *lines, self._buffer = self._buffer.split("\n")
+        for line in lines:
+            await self.queue.put(line + "\n")
+
+    async def flush(self):
+        pass
+
+class InProcessChild(ServerChild):
+    """A FastMCP server imported as a module and served on the pipe's loop.
+
+    The server object's low-level MCP server runs behind the regular stdio
+    transport, wired to in-memory queues instead of OS pipes, so no extra
+    interpreter is started. It shares the pipe's os.environ, so entries
+    with their own ``env`` must run as a process instead.
+    """
+
+    def __init__(self, name, source, attr="mcp"):
+        super().__init__(name)
+        self.source = source
+        self.attr = attr
+        self._inbox = None
+        self._outbox = None
+
+    @property
+    def alive(self):
+        return self.process is not None and not self.process.done() and not self._eof
+
+    @property
+    def pid(self):
+        return os.getpid() if self.process is not None else None
+
+    def pid_alive(self):
+        return self.alive
+
+    async def _spawn(self):
+        server = load_inprocess_server(self.source, self.attr)
+        self._inbox = asyncio.Queue()
+        self._outbox = asyncio.Queue()
+        self.process = asyncio.create_task(self._serve(server))
+        logger.info(f"[{self.name}] Serving {self.source}:{self.attr} in-process")
+        return []
+
+    async def _serve(self, server):
+        from mcp.server.stdio import stdio_server
+        lifespan = getattr(server, "_lifespan_manager", None)
+        try:
+            async with (lifespan() if lifespan else contextlib.nullcontext()):
+                async with stdio_server(
+                    stdin=_QueueLineReader(self._inbox),
+                    stdout=_QueueLineWriter(self._outbox)
+                ) as (read_stream, write_stream):
+                    await server._mcp_server.run(
+                        read_stream,
+                        write_stream,
+                        server._mcp_server.create_initialization_options()
+                    )
+        except Exception as e:
+            logger.error(f"[{self.name}] In-process server failed: {e}")
+        finally:
+            self._outbox.put_nowait(None)
+
+    async def _terminate(self):
+        logger.info(f"[{self.name}] Stopping in-process server")
+        self._inbox.put_nowait(None)
+        try:
+            await asyncio.wait_for(asyncio.shield(self.process), timeout=5)
+        except asyncio.TimeoutError:
+            self.process.cancel()
+        logger.info(f"[{self.name}] In-process server stopped")
+
+    async def _wait_exit(self):
+        await asyncio.wait([self.process])
+        return None
+
+    async def _readline(self):
+        line = await self._outbox.get()
+        return line or ""
+
+    async def _write(self, data):
+        if not self.alive:
+            raise ConnectionResetError(f"[{self.name}] In-process server is not running")
+        await self._inbox.put(data + "\n")
+
+class Multiplexer:
+    """Serve one or more :class:`ServerChild` over a single upstream WebSocket.
+
+    ``initialize`` and ``tools/list`` fan out to every child and are merged
+    into one answer; ``tools/call`` is routed to the child that owns the tool.
+    Tool names that collide between children are exposed as
+    ``<server>__<tool>``. With a single child the pipe is transparent: its
+    own initialize and tools/list results are returned unchanged, other
+    methods are passed through and so are its server-to-client requests.
+    """
+
+    def __init__(self, children, label=MULTIPLEX_LABEL):
+        self.children = list(children)
+        self.label = label
+        self.tool_routes = {}  # exposed tool name -> (child, original name)
+        self.in_flight = {}  # upstream id -> handler task
+        self.websocket = None
+        self.status = ConnectionStatus(label)
+
+    async def connect(self, uri, label=None):
+        """Connect once and serve the children until the connection drops.
+
+        The children keep running after the connection closes.
+        """
+        label = label or self.label
+        try:
+            logger.info(f"[{label}] Connecting to WebSocket server...")
+            async with websockets.connect(uri) as websocket:
+                logger.info(f"[{label}] Successfully connected to WebSocket server")
+                self.websocket = websocket
+                self.status.set_state("connected")
+                metrics.connected.set(label, value=1)
+                for child in self.children:
+                    child.sink = self.forward_to_websocket
+                await self.pipe_websocket_to_children()
+        except websockets.exceptions.ConnectionClosed as e:
+            logger.error(f"[{label}] WebSocket connection closed: {e}")
+            raise
+        except Exception as e:
+            logger.error(f"[{label}] Connection error: {e}")
+            raise
+        finally:
+            self.websocket = None
+            if self.status.state == "connected":
+                self.status.set_state("connecting")
+            metrics.connected.set(label, value=0)
+            for child in self.children:
+                child.sink = None
+            for task in list(self.in_flight.values()):
+                task.cancel()
+            self.in_flight.clear()
+
+    async def pipe_websocket_to_children(self):
+        """Read upstream messages and dispatch them without blocking the reader."""
+        while True:
+            message = await self.websocket.recv()
+            logger.debug(f"[{self.label}] << {message[:120]}...")
+            metrics.message("websocket", self.label, "in", message)
+            self.status.last_message = time.monotonic()
+            if isinstance(message, bytes):
+                message = message.decode('utf-8')
+            try:
+                message = json.loads(message)
+            except json.JSONDecodeError as e:
+                logger.warning(f"[{self.label}] Dropping invalid JSON from WebSocket: {e}")
+                metrics.errors.inc(self.label, "invalid_json")
+                continue
+            if isinstance(message, dict):
+                await self.dispatch(message)
+
+    async def dispatch(self, message):
+        method = message.get("method")
+        msg_id = message.get("id")
+        if method is None:
+            # Answers to server-to-client requests, which only a single child forwards
+            child = self.children[0]
+            if msg_id is not None and len(self.children) == 1 and child.alive:
+                await child.send(message)
+            return
+        if msg_id is None:
+            await self.handle_notification(message)
+            return
+        handler = {
+            "initialize": self.handle_initialize,
+            "tools/list": self.handle_tools_list,
+            "tools/call": self.handle_tools_call,
+            "ping": self.handle_ping,
+        }.get(method, self.handle_other)
+        task = asyncio.create_task(self._run_handler(handler, message, time.monotonic()))
+        self.in_flight[msg_id] = task
+        task.add_done_callback(lambda _t, key=msg_id: self.in_flight.pop(key, None))
+
+    async def _run_handler(self, handler, message, received):
+        server, tool = self.metric_labels(message)
+        method = message.get("method")
+        outcome = "cancelled"
+        metrics.request_started(server)
+        try:
+            try:
+                response = await handler(message)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"[{self.label}] {method} failed: {e}")
+                metrics.errors.inc(self.label, "handler")
+                response = jsonrpc_error(message.get("id"), -32603, str(e))
+            try:
+                await self.send_upstream(response)
+            except websockets.exceptions.ConnectionClosed:
+                logger.warning(f"[{self.label}] Dropped response to {method}: connection closed")
+                metrics.errors.inc(self.label, "dropped_response")
+            if "error" in response:
+                outcome = "error"
+            elif (response.get("result") or {}).get("isError"):
+                outcome = "tool_error"
+            else:
+                outcome = "ok"
+        finally:
+            metrics.request_finished(server, method, tool, outcome, time.monotonic() - received)
+
+    def metric_labels(self, message):
+        """Return the (server, tool) metric labels of an upstream request."""
+        if message.get("method") == "tools/call":
+            route = self.tool_routes.get((message.get("params") or {}).get("name"))
+            if route is None:
+                return self.label, "unknown"  # keep label values bounded
+            return route[0].name, route[1]
+        server = self.children[0].name if len(self.children) == 1 else self.label
+        return server, ""
+
+    async def handle_notification(self, message):
+        method = message.get("method")
+        if method == "notifications/initialized":
+            return  # The pipe completes each child's handshake itself
+        if method == "notifications/cancelled":
+            task = self.in_flight.get((message.get("params") or {}).get("requestId"))
+            if task is not None:
+                task.cancel()
+            return
+        for child in self.ready_children():
+            await child.send(message)
+
+    async def handle_ping(self, message):
+        return {"jsonrpc": "2.0", "id": message["id"], "result": {}}
+
+    async def handle_initialize(self, message):
+        params = message.get("params") or {}
+        results = await self.fan_out(self.children, lambda child: child.initialize(params))
+        if len(self.children) == 1:
+            if not results:
+                return jsonrpc_error(message["id"], -32603, f"Server '{self.children[0].name}' failed to initialize")
+            return {"jsonrpc": "2.0", "id": message["id"], "result": results[0][1]}
+        protocol_version = params.get("protocolVersion")
+        for child, result in results:
+            protocol_version = protocol_version or result.get("protocolVersion")
+        return {
+            "jsonrpc": "2.0",
+            "id": message["id"],
+            "result": {
+                "protocolVersion": protocol_version,
+                "capabilities": {"tools": {}},
+                "serverInfo": {"name": "mcp_pipe", "version": PIPE_VERSION},
+            },
+        }
+
+    async def handle_tools_list(self, message):
+        if len(self.children) == 1:
+            return await self.handle_single_tools_list(message)
+        results = await self.fan_out(self.ready_children(), lambda child: child.list_tools())
+        owners = {}
+        for child, result in results:
+            for tool in result.get("tools", []):
+                owners.setdefault(tool.get("name"), []).append((child, tool))
+
+        self.tool_routes = {}
+        tools = []
+        for name, entries in owners.items():
+            for child, tool in entries:
+                exposed = name if len(entries) == 1 else f"{child.name}{TOOL_NAMESPACE_SEPARATOR}{name}"
+                self.tool_routes[exposed] = (child, name)
+                tools.append({**tool, "name": exposed})
+        logger.info(f"[{self.label}] Exposing {len(tools)} tools from {len(results)} servers")
+        return {"jsonrpc": "2.0", "id": message["id"], "result": {"tools": tools}}
+
+    async def handle_single_tools_list(self, message):
+        """Return the only child's tools/list result unchanged (nextCursor, _meta...)."""
+        child = self.children[0]
+        if not child.ready:
+            return jsonrpc_error(message["id"], -32603, f"Server '{child.name}' is not running")
+        params = message.get("params") or {}
+        if params.get("cursor") is None:
+            result = await child.list_tools()
+            self.tool_routes = {}
+        else:
+            response = await child.request({"jsonrpc": "2.0", "method": "tools/list", "params": params})
+            if "error" in response:
+                return {**response, "id": message["id"]}
+            result = response.get("result") or {}
+        for tool in result.get("tools", []):
+            self.tool_routes[tool.get("name")] = (child, tool.get("name"))
+        return {"jsonrpc": "2.0", "id": message["id"], "result": result}
+
+    async def handle_tools_call(self, message):
+        params = dict(message.get("params") or {})
+        route = self.tool_routes.get(params.get("name"))
+        if route is None and len(self.children) == 1:
+            route = (self.children[0], params.get("name"))  # transparent: let the server decide
+        if route is None:
+            return jsonrpc_error(message["id"], -32602, f"Unknown tool: {params.get('name')}")
+        child, original_name = route
+        if not child.ready:
+            state = "restarting" if child.restarting else "not running"
+            return jsonrpc_error(message["id"], -32603, f"Server '{child.name}' is {state}")
+        params["name"] = original_name
+        response = await child.request({"jsonrpc": "2.0", "method": "tools/call", "params": params})
+        return {**response, "id": message["id"]}
+
+    async def handle_other(self, message):
+        """Pass unknown methods through to a single child; refuse them otherwise."""
+        if len(self.children) != 1:
+            return jsonrpc_error(message["id"], -32601, f"Method not found: {message.get('method')}")
+        child = self.children[0]
+        if not child.ready:
+            return jsonrpc_error(message["id"], -32603, f"Server '{child.name}' is not running")
+        response = await child.request({key: value for key, value in message.items() if key != "id"})
+        return {**response, "id": message["id"]}
+
+    async def fan_out(self, children, call):
+        """Await ``call(child)`` for every child; return the successful results."""
+        outcomes = await asyncio.gather(*(call(child) for child in children), return_exceptions=True)
+        results = []
+        for child, outcome in zip(children, outcomes):
+            if isinstance(outcome, asyncio.CancelledError):
+                raise outcome
+            if isinstance(outcome, BaseException):
+                logger.warning(f"[{child.name}] Request failed: {outcome!r}")
+            else:
+                results.append((child, outcome))
+        return results
+
+    def ready_children(self):
+        return [child for child in self.children if child.ready]
+
+    async def forward_to_websocket(self, child, message):
+        """Forward child notifications (progress, logging, ...) upstream.
+
+        Server-to-client requests are forwarded only from a single child;
+        with several, their ids could collide in the shared session.
+        """
+        if "method" in message and "id" in message and len(self.children) != 1:
+            await child.send(jsonrpc_error(message["id"], -32601, "Not supported by mcp_pipe"))
+            return
+        try:
+            await self.send_upstream(message)
+        except websockets.exceptions.ConnectionClosed:
+            pass  # The session is going away; the reader will notice
+
+    async def send_upstream(self, message):
+        if self.websocket is None:
+            return
+        data = json.dumps(message, ensure_ascii=False)
+        logger.debug(f"[{self.label}] >> {data[:120]}...")
+        metrics.message("websocket", self.label, "out", data)
+        await self.websocket.send(data)
+
+def health_report(multiplexers, children):
+    """Build the /healthz and /readyz answers: (live, ready, details).
+
+    Live fails when a server process is gone or every connection has been
+    down for longer than HEALTH_GRACE (e.g. stuck in a long backoff); ready
+    additionally needs every connection open and every server initialized.
+    """
+    now = time.monotonic()
+    connections = [m.status.to_dict(now) for m in multiplexers]
+    servers = [child.to_dict(now) for child in children]
+    # A server inside its restart budget is still considered live
+    children_alive = all(server["alive"] or server["restarting"] for server in servers)
+    connections_down = bool(multiplexers) and all(m.status.down_for(now) > HEALTH_GRACE for m in multiplexers)
+    live = children_alive and not connections_down
+    ready = live and all(m.status.state == "connected" for m in multiplexers) and all(s["ready"] for s in servers)
+    details = {
+        "status": "ok" if ready else ("degraded" if live else "unhealthy"),
+        "version": PIPE_VERSION,
+        "uptime": round(now - STARTED_AT, 1),
+        "connections": connections,
+        "servers": servers,
+    }
+    return live, ready, details
+
+def health_routes(multiplexers, children):
+    """HTTP routes for serve_http: /healthz (liveness) and /readyz (readiness)."""
+    def respond(which):
+        def route():
+            live, ready, details = health_report(multiplexers, children)
+            ok = live if which == "live" else ready
+            return (200 if ok else 503), "application/json", json.dumps(details, ensure_ascii=False) + "\n"
+        return route
+    return {"/healthz": respond("live"), "/readyz": respond("ready")}
+
 def signal_handler(sig, frame):
     """Handle interrupt signals"""
     logger.info("Received interrupt signal, shutting down...")
     sys.exit(0)
 
+def multiplex_enabled(cfg=None):
+    """Return True when all servers should share one upstream connection."""
+    env = os.environ.get("MCP_MULTIPLEX")
+    if env is not None:
+        return env.strip().lower() in ("1", "true", "yes", "on")
+    cfg = load_config() if cfg is None else cfg
+    return bool(cfg.get("multiplex")) if isinstance(cfg, dict) else False
+
 def load_config():
     """Load JSON config from $MCP_CONFIG or ./mcp_config.json. Return dict or {}."""
     path = os.environ.get("MCP_CONFIG") or os.path.join(os.getcwd(), "mcp_config.json")
@@ -239,6 +1082,54 @@ def build_server_command(target=None):
         )
     return [sys.executable, script_path], os.environ.copy()
 
+def create_child(target):
+    """Return the child that serves ``target``: a process, or in-process for type=inprocess."""
+    cfg = load_config()
+    servers = cfg.get("mcpServers", {}) if isinstance(cfg, dict) else {}
+    entry = servers.get(target) or {}
+    typ = (entry.get("type") or entry.get("transportType") or "stdio").lower()
+    if typ != "inprocess":
+        return ServerChild(target)
+
+    source = entry.get("module")
+    if not source:
+        source = next((str(a) for a in entry.get("args") or [] if str(a).endswith(".py")), None)
+    if not source:
+        raise RuntimeError(f"Server '{target}' (type inprocess) is missing 'module'")
+    if entry.get("env"):
+        # Servers, their shared helper modules and calc_sandbox's workers read
+        # os.environ at import and at call time; a per-entry copy cannot reach them all
+        raise RuntimeError(
+            f"Server '{target}' (type inprocess) cannot set 'env': in-process servers share "
+            f"the pipe's environment; set it in .env or use type stdio"
+        )
+    return InProcessChild(target, source, entry.get("object") or "mcp")
+
+def load_inprocess_server(source, attr="mcp"):
+    """Import ``source`` (module name or .py path) and return its FastMCP object."""
+    if source.endswith(".py"):
+        path = os.path.abspath(source)
+        name = os.path.splitext(os.path.basename(path))[0]
+        module = sys.modules.get(name)
+        if module is None:
+            # Let the script import its sibling helper modules
+            if os.path.dirname(path) not in sys.path:
+                sys.path.insert(0, os.path.dirname(path))
+            spec = importlib.util.spec_from_file_location(name, path)
+            module = importlib.util.module_from_spec(spec)
+            sys.modules[name] = module
+            try:
+                spec.loader.exec_module(module)
+            except BaseException:
+                sys.modules.pop(name, None)
+                raise
+    else:
+        module = importlib.import_module(source)
+    server = getattr(module, attr, None)
+    if server is None or not hasattr(server, "_mcp_server"):
+        raise RuntimeError(f"'{source}' has no FastMCP object named '{attr}'")
+    return server
+
 if __name__ == "__main__":
     # Register signal handler
     signal.signal(signal.SIGINT, signal_handler)
@@ -263,16 +1154,48 @@ if __name__ == "__main__":
                 logger.info(f"Skipping disabled servers: {', '.join(skipped)}")
             if not enabled:
                 raise RuntimeError("No enabled mcpServers found in config")
+        elif os.path.exists(target_arg):
+            cfg = {}
+            enabled = [target_arg]
+        else:
+            logger.error("Argument must be a local Python script path. To run configured servers, run without arguments.")
+            sys.exit(1)
+
+        # Server processes are started once and kept warm across reconnects
+        children = [create_child(t) for t in enabled]
+        multiplex = len(children) > 1 and multiplex_enabled(cfg)
+        if multiplex:
+            multiplexers = [Multiplexer(children)]
+        else:
+            multiplexers = [Multiplexer([child], label=child.name) for child in children]
+        routes = {"/metrics": lambda: (200, METRICS_CONTENT_TYPE, metrics.render())}
+        routes.update(health_routes(multiplexers, children))
+        status_server = None
+        try:
+            status_server = await serve_http(routes)
+        except OSError as e:
+            logger.warning(f"Metrics and health endpoint disabled: {e}")
+        try:
+            started = await asyncio.gather(*(child.ensure_started() for child in children), return_exceptions=True)
+            for child, outcome in zip(children, started):
+                if isinstance(outcome, Exception):
+                    logger.error(f"[{child.name}] Failed to start server process: {outcome}")
+            if multiplex:
+                logger.info(f"Starting servers over one connection: {', '.join(enabled)}")
+                multiplexer = multiplexers[0]
+                await connect_with_retry(endpoint_url, MULTIPLEX_LABEL, multiplexer.connect, multiplexer.status)
+                return
             logger.info(f"Starting servers: {', '.join(enabled)}")
-            tasks = [asyncio.create_task(connect_with_retry(endpoint_url, t)) for t in enabled]
+            tasks = [
+                asyncio.create_task(connect_with_retry(endpoint_url, m.label, m.connect, m.status))
+                for m in multiplexers
+            ]
             # Run all forever; if any crashes it will auto-retry inside
             await asyncio.gather(*tasks)
-        else:
-            if os.path.exists(target_arg):
-                await connect_with_retry(endpoint_url, target_arg)
-            else:
-                logger.error("Argument must be a local Python script path. To run configured servers, run without arguments.")
-                sys.exit(1)
+        finally:
+            if status_server is not None:
+                status_server.close()
+            await asyncio.gather(*(child.stop() for child in children), return_exceptions=True)
 
     try:
         asyncio.run(_main())
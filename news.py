@@ -1,16 +1,17 @@
 # news.py
 from fastmcp import FastMCP
-import urllib.request
-import xml.etree.ElementTree as ET
-import re
 import sys
+from feed_utils import FeedCache, FeedPrefetcher
 
 # Fix UTF-8 encoding for Windows console
 if sys.platform == 'win32':
     sys.stderr.reconfigure(encoding='utf-8')
     sys.stdout.reconfigure(encoding='utf-8')
 
-mcp = FastMCP("NewsFetcher")
+def feed_lifespan(server):
+    return feed_prefetcher.lifespan(server)
+
+mcp = FastMCP("NewsFetcher", lifespan=feed_lifespan)
 
 # === Nguồn RSS theo chủ đề ===
 RSS_FEEDS = {
@@ -31,96 +32,30 @@ RSS_FEEDS = {
     "oto-xe-may": "https://vnexpress.net/rss/oto-xe-may.rss",
 }
 
-_TAG_RE = re.compile(r"<[^>]+>")
-
-def strip_html(text):
-    if not text:
-        return ""
-    no_tags = _TAG_RE.sub("", text)
-    no_images = re.sub(r"https?://\S+\.(?:png|jpg|jpeg|gif|svg)\S*", "", no_tags, flags=re.IGNORECASE)
-    no_images = re.sub(r"data:image/[^;\s]+;base64,[A-Za-z0-9+/=]+", "", no_images, flags=re.IGNORECASE)
-    return " ".join(no_images.split())
-
-def parse_xml_to_dict(xml_text):
-    root = ET.fromstring(xml_text)
-
-    def elem_to_dict(elem):
-        children = list(elem)
-        if not children:
-            text = elem.text.strip() if elem.text and elem.text.strip() else ""
-            if elem.attrib:
-                data = {"_text": text} if text else {}
-                data.update({f"@{k}": v for k, v in elem.attrib.items()})
-                return data
-            return text
-
-        result = {}
-        for k, v in elem.attrib.items():
-            result[f"@{k}"] = v
-        for child in children:
-            child_val = elem_to_dict(child)
-            tag = child.tag
-            if tag in result:
-                if not isinstance(result[tag], list):
-                    result[tag] = [result[tag]]
-                result[tag].append(child_val)
-            else:
-                result[tag] = child_val
-        return result
-
-    return {root.tag: elem_to_dict(root)}
-
-def extract_rss_items(parsed):
-    items = []
-    if "rss" in parsed:
-        channel = parsed["rss"].get("channel", {})
-        raw_items = channel.get("item", [])
-    elif "feed" in parsed:
-        raw_items = parsed["feed"].get("entry", [])
-    else:
-        raw_items = parsed.get("item", [])
-    if isinstance(raw_items, dict):
-        raw_items = [raw_items]
-    for it in raw_items:
-        simple = {}
-        if isinstance(it, dict):
-            for k, v in it.items():
-                val = v["_text"] if isinstance(v, dict) and "_text" in v and len(v) == 1 else v
-                if isinstance(val, str):
-                    simple[k] = strip_html(val)
-                else:
-                    simple[k] = val
-        else:
-            simple["content"] = strip_html(str(it))
-        items.append(simple)
-    return items
+# Cache RSS đã parse, theo URL (TTL + ETag/Last-Modified)
+feed_cache = FeedCache()
+feed_prefetcher = FeedPrefetcher(feed_cache, RSS_FEEDS.values())
 
 @mcp.tool()
-def get_latest_news(topic: str = "tin-moi", limit: int = 5) -> dict:
+async def get_latest_news(topic: str = "tin-moi", limit: int = 5) -> dict:
     """
     Lấy tin tức mới nhất từ VNExpress theo chủ đề.
     Chủ đề hỗ trợ: tin-moi, the-gioi, thoi-su, the-thao, cong-nghe (so-hoa), giai-tri, kinh-doanh, suc-khoe, du-lich, ...
     """
     url = RSS_FEEDS.get(topic, RSS_FEEDS["tin-moi"])
     try:
-        req = urllib.request.Request(url, headers={
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-        })
-        with urllib.request.urlopen(req, timeout=10) as response:
-            xml_content = response.read().decode('utf-8')
+        items = await feed_cache.get(url, limit=limit, timeout=10)
     except Exception as e:
         return {"success": False, "message": f"Không thể tải RSS: {e}"}
 
     try:
-        parsed = parse_xml_to_dict(xml_content)
-        items = extract_rss_items(parsed)
         results = [
             {
                 "title": i.get("title", "Không có tiêu đề"),
                 "link": i.get("link", ""),
                 "description": i.get("description", "")[:200] + "..."
             }
-            for i in items[:limit]
+            for i in items
         ]
         return {"success": True, "topic": topic, "items": results}
     except Exception as e:
@@ -0,0 +1,250 @@
+# coding: utf-8
+"""
+Prometheus-style metrics for mcp_pipe.py.
+- Counter, Gauge, Histogram: labelled in-memory metrics rendered in the
+  Prometheus text exposition format; no client library needed.
+- PipeMetrics: the pipe's metric set (per-server/per-tool request latency,
+  in-flight requests, messages, bytes, errors, reconnects).
+- serve_http: a minimal asyncio HTTP server for a few GET routes, used for
+  the local /metrics endpoint and the pipe's /healthz and /readyz.
+
+Env overrides:
+    MCP_METRICS_PORT   port of the local HTTP endpoint (default 9464, 0 disables)
+    MCP_METRICS_HOST   address it binds to (default 127.0.0.1)
+"""
+
+import asyncio
+import logging
+import os
+from collections import defaultdict
+
+logger = logging.getLogger('PipeMetrics')
+
+METRICS_PORT = int(os.getenv("MCP_METRICS_PORT", "9464"))
+METRICS_HOST = os.getenv("MCP_METRICS_HOST", "127.0.0.1")
+
+# Seconds; voice replies care about the 0.1s-10s range
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# MCP request methods kept as `method` label values; anything else an endpoint
+# sends is counted as "other" so it cannot create unbounded time series
+MCP_METHODS = frozenset((
+    "initialize", "ping", "tools/list", "tools/call", "resources/list",
+    "resources/templates/list", "resources/read", "resources/subscribe",
+    "resources/unsubscribe", "prompts/list", "prompts/get", "completion/complete",
+    "logging/setLevel",
+))
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in (*zip(names, values), *extra)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class Counter:
+    """Monotonic value per label set."""
+
+    kind = "counter"
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.values = defaultdict(float)
+
+    def inc(self, *labels, amount=1):
+        self.values[labels] += amount
+
+    def get(self, *labels):
+        return self.values.get(labels, 0)
+
+    def samples(self):
+        for labels, value in sorted(self.values.items()):
+            yield self.name, _format_labels(self.labels, labels), value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines += [f"{name}{labels} {_format_value(value)}" for name, labels, value in self.samples()]
+        return lines
+
+
+class Gauge(Counter):
+    """Value per label set that can go up and down."""
+
+    kind = "gauge"
+
+    def set(self, *labels, value):
+        self.values[labels] = value
+
+    def dec(self, *labels, amount=1):
+        self.values[labels] -= amount
+
+
+class Histogram(Counter):
+    """Cumulative bucket counts, sum and count per label set."""
+
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        self.values = {}  # labels -> [bucket counts..., sum, count]
+
+    def observe(self, *labels, value):
+        state = self.values.get(labels)
+        if state is None:
+            state = self.values[labels] = [0] * len(self.buckets) + [0.0, 0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                state[i] += 1
+        state[-2] += value
+        state[-1] += 1
+
+    def get(self, *labels):
+        state = self.values.get(labels)
+        return (0, 0.0) if state is None else (state[-1], state[-2])
+
+    def samples(self):
+        for labels, state in sorted(self.values.items()):
+            for bound, count in zip(self.buckets, state):
+                le = (("le", _format_value(bound)),)
+                yield f"{self.name}_bucket", _format_labels(self.labels, labels, le), count
+            yield f"{self.name}_sum", _format_labels(self.labels, labels), state[-2]
+            yield f"{self.name}_count", _format_labels(self.labels, labels), state[-1]
+
+
+class PipeMetrics:
+    """The metric set of one mcp_pipe process.
+
+    ``connection`` labels are WebSocket sessions (a server name, or
+    "multiplex"); ``server`` labels are the child servers behind them.
+    """
+
+    def __init__(self):
+        self.requests = Counter(
+            "mcp_pipe_requests_total",
+            "Upstream JSON-RPC requests answered, by outcome (ok, error, tool_error, cancelled).",
+            ("server", "method", "tool", "outcome"),
+        )
+        self.latency = Histogram(
+            "mcp_pipe_request_duration_seconds",
+            "Time from receiving an upstream request to sending its response.",
+            ("server", "method", "tool"),
+        )
+        self.in_flight = Gauge(
+            "mcp_pipe_requests_in_flight",
+            "Upstream requests received but not answered yet.",
+            ("server",),
+        )
+        self.messages = Counter(
+            "mcp_pipe_messages_total",
+            "JSON-RPC messages passed through the pipe; direction is seen from the pipe.",
+            ("peer", "name", "direction"),
+        )
+        self.bytes = Counter(
+            "mcp_pipe_bytes_total",
+            "Bytes of JSON-RPC messages passed through the pipe.",
+            ("peer", "name", "direction"),
+        )
+        self.errors = Counter(
+            "mcp_pipe_errors_total",
+            "Pipe-level errors (invalid JSON, failed handlers, dropped responses).",
+            ("connection", "kind"),
+        )
+        self.reconnects = Counter(
+            "mcp_pipe_reconnects_total",
+            "WebSocket sessions that ended and will be retried.",
+            ("connection",),
+        )
+        self.backpressure = Counter(
+            "mcp_pipe_backpressure_total",
+            "Sessions refused or closed by the endpoint for load (close code 4004, HTTP 429).",
+            ("connection",),
+        )
+        self.child_restarts = Counter(
+            "mcp_pipe_child_restarts_total",
+            "Server processes restarted by the pipe after they exited on their own.",
+            ("server",),
+        )
+        self.connected = Gauge(
+            "mcp_pipe_connected",
+            "1 while the WebSocket session is open.",
+            ("connection",),
+        )
+        self.all = [self.requests, self.latency, self.in_flight, self.messages,
+                    self.bytes, self.errors, self.reconnects, self.backpressure,
+                    self.child_restarts, self.connected]
+
+    def message(self, peer, name, direction, data):
+        """Count one message of ``data`` (str or bytes) to or from a websocket or child."""
+        size = len(data.encode("utf-8")) if isinstance(data, str) else len(data)
+        self.messages.inc(peer, name, direction)
+        self.bytes.inc(peer, name, direction, amount=size)
+
+    def request_started(self, server):
+        self.in_flight.inc(server)
+
+    def request_finished(self, server, method, tool, outcome, duration):
+        method = method if isinstance(method, str) and method in MCP_METHODS else "other"
+        self.in_flight.dec(server)
+        self.requests.inc(server, method, tool, outcome)
+        if outcome != "cancelled":
+            self.latency.observe(server, method, tool, value=duration)
+
+    def render(self):
+        lines = []
+        for metric in self.all:
+            lines += metric.render()
+        return "\n".join(lines) + "\n"
+
+
+metrics = PipeMetrics()
+
+
+async def serve_http(routes, host=METRICS_HOST, port=METRICS_PORT):
+    """Serve ``routes`` ({path: callable() -> (status, content_type, body)}) over HTTP/1.0.
+
+    Returns the asyncio server, or None if ``port`` is 0.
+    """
+    if not port:
+        return None
+
+    async def handle(reader, writer):
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), 5)
+            while (await asyncio.wait_for(reader.readline(), 5)) not in (b"\r\n", b"\n", b""):
+                pass  # headers are not needed
+            method, path = (request_line.decode("latin-1").split() + ["", ""])[:2]
+            route = routes.get(path.split("?", 1)[0])
+            if method not in ("GET", "HEAD"):
+                status, content_type, body = 405, "text/plain", "method not allowed\n"
+            elif route is None:
+                status, content_type, body = 404, "text/plain", "not found\n"
+            else:
+                status, content_type, body = route()
+            payload = body.encode("utf-8")
+            reason = {200: "OK", 404: "Not Found", 405: "Method Not Allowed"}.get(status, "Service Unavailable")
+            head = (f"HTTP/1.0 {status} {reason}\r\nContent-Type: {content_type}\r\n"
+                    f"Content-Length: {len(payload)}\r\nConnection: close\r\n\r\n")
+            writer.write(head.encode("latin-1") + (b"" if method == "HEAD" else payload))
+            await writer.drain()
+        except Exception as e:
+            logger.debug(f"HTTP request failed: {e}")
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(handle, host, port)
+    logger.info(f"Serving {', '.join(sorted(routes))} on http://{host}:{port}")
+    return server
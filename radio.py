@@ -10,7 +10,13 @@ Radio Stations and Music MCP tool
 from fastmcp import FastMCP
 import logging
 import sys
+import urllib.parse
 from typing import List, Dict, Optional
+import httpx
+import http_client
+from cache_utils import SingleFlight
+from job_utils import DONE, JOB_INLINE_WAIT, MAX_POLL_WAIT, JobQueue, QueueFullError
+from search_utils import FuzzyIndex
 
 # Ensure UTF-8 output on Windows consoles
 if sys.platform == "win32":
@@ -25,6 +31,10 @@ logging.basicConfig(level=logging.DEBUG, format="%(levelname)s:%(name)s:%(messag
 # Use service name in Docker, fallback to localhost for local development
 import os
 MP3_PROXY_URL = os.getenv("MP3_PROXY_URL", "http://mp3-proxy:5005")
+# Coalesces identical in-flight searches so a popular song hits the proxy once
+search_flight = SingleFlight()
+# get_music_stream resolutions run in the background under a bounded queue
+stream_jobs = JobQueue("Radio stream")
 
 # Define the radio stations data
 # Structure: Key (ID) -> {name, url, description, genre, volume}
@@ -122,6 +132,32 @@ RADIO_STATIONS = {
     }
 }
 
+# Spoken variants of station names, matched with diacritics and punctuation ignored
+STATION_ALIASES = {
+    "VOV1": ["VOV một", "Đài Tiếng nói Việt Nam"],
+    "VOV2": ["VOV hai"],
+    "VOV3": ["VOV ba"],
+    "VOV5": ["VOV năm"],
+    "VOVGT": ["VOV giao thông", "VOV GT Hà Nội", "Giao thông Hà Nội"],
+    "VOVGT_HCM": ["VOV giao thông Sài Gòn", "VOV giao thông TP HCM", "VOV GT HCM", "Giao thông Sài Gòn", "Sài Gòn", "HCM"],
+    "VOV_ENGLISH": ["VOV English", "VOV 24/7"],
+    "VOV_MEKONG": ["VOV Mekong", "VOV miền Tây", "VOV Cửu Long"],
+    "VOV_MIENTRUNG": ["VOV 4 miền Trung"],
+    "VOV_TAYBAC": ["VOV 4 Tây Bắc"],
+    "VOV_DONGBAC": ["VOV 4 Đông Bắc"],
+    "VOV_TAYNGUYEN": ["VOV 4 Tây Nguyên"],
+    "ZING_RADIO": ["Zing", "Zing MP3", "Radio Zing"],
+}
+
+def build_station_index() -> FuzzyIndex:
+    """Index every station by ID, name and aliases (built once at import)."""
+    index = FuzzyIndex()
+    for station_id, data in RADIO_STATIONS.items():
+        index.add(station_id, station_id, data["name"], *STATION_ALIASES.get(station_id, ()))
+    return index
+
+STATION_INDEX = build_station_index()
+
 @mcp.tool()
 def get_radio_stations() -> List[Dict[str, str]]:
     """
@@ -144,46 +180,43 @@ def get_radio_station_url(station_id_or_name: str) -> Dict[str, any]:
     """
     Get the streaming URL for a specific radio station.
     Args:
-        station_id_or_name: The ID (e.g., "VOV1") or name (e.g., "VOV 1") of the station.
+        station_id_or_name: The ID (e.g., "VOV1") or name (e.g., "VOV 1", "vov một",
+            "vov giao thông sài gòn") of the station; accents and spacing are optional.
     Returns:
-        A dictionary with "url", "name", and "volume" if found, or an error message.
+        A dictionary with "url", "name", and "volume" for the best match (plus "alternatives"
+        when the match is approximate), or an error message (with "alternatives" when
+        only weak matches were found).
     """
-    query = station_id_or_name.lower().strip()
-
-    # Direct ID match
-    if station_id_or_name in RADIO_STATIONS:
-        data = RADIO_STATIONS[station_id_or_name]
-        return {"url": data["url"], "name": data["name"], "volume": data["volume"]}
-
-    # Case-insensitive ID match
-    for sid, data in RADIO_STATIONS.items():
-        if sid.lower() == query:
-            return {"url": data["url"], "name": data["name"], "volume": data["volume"]}
-
-    # Name match (partial)
-    for sid, data in RADIO_STATIONS.items():
-        if query in data["name"].lower():
-            return {"url": data["url"], "name": data["name"], "volume": data["volume"]}
+    matches = STATION_INDEX.search(station_id_or_name, limit=3)
+    if not matches:
+        result = {"error": f"Station '{station_id_or_name}' not found."}
+        # Only weak matches: suggest them without picking one
+        weak = STATION_INDEX.search(station_id_or_name, limit=3, min_coverage=0)
+        if weak:
+            result["alternatives"] = [RADIO_STATIONS[sid]["name"] for sid, _ in weak]
+        return result
 
-    return {"error": f"Station '{station_id_or_name}' not found."}
+    station_id, score = matches[0]
+    data = RADIO_STATIONS[station_id]
+    result = {"url": data["url"], "name": data["name"], "volume": data["volume"]}
+    # Let the assistant offer other stations when the match was only approximate
+    if score < 1 and len(matches) > 1:
+        result["alternatives"] = [RADIO_STATIONS[sid]["name"] for sid, _ in matches[1:]]
+    return result
 
-def _search_music_internal(song: str, artist: str = "") -> Dict[str, any]:
+async def _search_music_internal(song: str, artist: str = "", timeout: float = 10) -> Dict[str, any]:
     """
     Internal function to search for music using the MP3 proxy service.
     """
-    import requests
-
     try:
         # Construct search URL
-        search_url = f"{MP3_PROXY_URL}/stream_pcm?song={requests.utils.quote(song)}"
+        search_url = f"{MP3_PROXY_URL}/stream_pcm?song={urllib.parse.quote(song)}"
         if artist:
-            search_url += f"&artist={requests.utils.quote(artist)}"
+            search_url += f"&artist={urllib.parse.quote(artist)}"
 
-        # Make request to mp3-proxy
-        response = requests.get(search_url, timeout=10)
-        response.raise_for_status()
-
-        data = response.json()
+        # Make request to mp3-proxy (identical concurrent searches share one request;
+        # the timeout is part of the key so a 60s stream job never inherits a 10s search)
+        data = await search_flight.do((search_url, timeout), http_client.fetch_json, search_url, timeout=timeout)
 
         # Check for error
         if "error" in data:
@@ -208,13 +241,13 @@ def _search_music_internal(song: str, artist: str = "") -> Dict[str, any]:
             "language": data.get("language", "unknown")
         }
 
-    except requests.RequestException as e:
+    except httpx.HTTPError as e:
         return {"error": f"Failed to search music: {str(e)}"}
     except Exception as e:
         return {"error": f"Unexpected error: {str(e)}"}
 
 @mcp.tool()
-def search_music(song: str, artist: str = "") -> Dict[str, any]:
+async def search_music(song: str, artist: str = "") -> Dict[str, any]:
     """
     Search for a song using the MP3 proxy service.
     Args:
@@ -223,20 +256,12 @@ def search_music(song: str, artist: str = "") -> Dict[str, any]:
     Returns:
         A dictionary with song metadata including stream URL, or an error message.
     """
-    return _search_music_internal(song, artist)
+    return await _search_music_internal(song, artist)
 
-@mcp.tool()
-def get_music_stream(song: str, artist: str = "") -> Dict[str, any]:
-    """
-    Get a music stream URL for playback. This is a convenience function that searches
-    and returns only the essential information needed for playback.
-    Args:
-        song: The name of the song to search for.
-        artist: The artist name (optional).
-    Returns:
-        A dictionary with stream URL and metadata for playback.
-    """
-    result = _search_music_internal(song, artist)
+async def _resolve_stream(song: str, artist: str = "") -> Dict[str, any]:
+    """Search and reduce the result to what playback needs.
+    Runs as a background job, so the proxy gets up to 60s to prepare the stream."""
+    result = await _search_music_internal(song, artist, timeout=60)
 
     if "error" in result:
         return result
@@ -248,6 +273,51 @@ def get_music_stream(song: str, artist: str = "") -> Dict[str, any]:
         "lyric_url": result["lyric_url"]
     }
 
+def _stream_job_response(job) -> Dict[str, any]:
+    if job.status == DONE:
+        return job.result
+    info = job.to_dict()
+    if job.error is None:
+        return {"pending": True, **info,
+                "message": "Stream is still being prepared, call get_stream_job_status(job_id) for the URL."}
+    return {**info, "error": f"Failed to resolve stream: {job.error}"}
+
+@mcp.tool()
+async def get_music_stream(song: str, artist: str = "") -> Dict[str, any]:
+    """
+    Get a music stream URL for playback. This is a convenience function that searches
+    and returns only the essential information needed for playback.
+    If the proxy needs longer than a few seconds, returns a job_id with pending=true instead;
+    call get_stream_job_status(job_id) to get the stream URL.
+    Args:
+        song: The name of the song to search for.
+        artist: The artist name (optional).
+    Returns:
+        A dictionary with stream URL and metadata for playback, or a pending job.
+    """
+    try:
+        job = stream_jobs.submit(("stream", song.casefold(), artist.casefold()), _resolve_stream, song, artist)
+    except QueueFullError:
+        return {"error": "Too many songs are being prepared, please try again shortly."}
+    await stream_jobs.wait(job, JOB_INLINE_WAIT)
+    return _stream_job_response(job)
+
+@mcp.tool()
+async def get_stream_job_status(job_id: str, wait: float = 0) -> Dict[str, any]:
+    """
+    Check a pending get_music_stream job.
+    Args:
+        job_id: The job_id returned by get_music_stream.
+        wait: Seconds to wait for the job to finish (max 25).
+    Returns:
+        The stream URL and metadata once done, otherwise the job status.
+    """
+    job = stream_jobs.get(job_id)
+    if job is None:
+        return {"error": f"Job {job_id} not found (it may have expired)."}
+    await stream_jobs.wait(job, min(max(wait, 0), MAX_POLL_WAIT))
+    return _stream_job_response(job)
+
 if __name__ == "__main__":
     logger.info("Starting Radio MCP Server")
     try:
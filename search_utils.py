@@ -0,0 +1,114 @@
+# coding: utf-8
+"""
+Small fuzzy-lookup helpers for matching spoken Vietnamese names.
+- fold_text: lowercase, strip diacritics (đ -> d) and punctuation, collapse
+  whitespace, so "VOV Giao thông Sài Gòn" and "vov giao thong sai gon" match.
+- FuzzyIndex: precomputed exact, token and trigram postings over a set of
+  keys (ids, names, aliases); one lookup returns ranked candidates without
+  scanning every entry.
+"""
+
+import re
+import unicodedata
+from collections import defaultdict
+
+_NON_ALNUM_RE = re.compile(r"[^0-9a-z]+")
+
+# Weight of whole-token matches vs character trigram matches in the score
+TOKEN_WEIGHT = 0.7
+TRIGRAM_WEIGHT = 0.3
+# Share of query tokens a candidate must account for, so one common word
+# ("vov") cannot make "vov sáu" match VOV1
+MIN_COVERAGE = 0.6
+# Trigram similarity at which a misspelt query token still counts ("zingg" ~ "zing")
+TOKEN_SIMILARITY = 0.5
+
+
+def fold_text(text):
+    """Return ``text`` lowercased, without diacritics or punctuation, single-spaced."""
+    text = unicodedata.normalize("NFD", text.replace("đ", "d").replace("Đ", "D"))
+    text = "".join(ch for ch in text if not unicodedata.combining(ch)).lower()
+    return " ".join(_NON_ALNUM_RE.sub(" ", text).split())
+
+
+def trigrams(folded):
+    """Character trigrams of a folded string with spaces removed ("vov1" == "vov 1")."""
+    compact = folded.replace(" ", "")
+    if len(compact) < 3:
+        return {compact} if compact else set()
+    return {compact[i:i + 3] for i in range(len(compact) - 2)}
+
+
+class FuzzyIndex:
+    """Ranked fuzzy lookup of keys by any of their names.
+
+    Each key is indexed under all of its texts: the compact folded form for
+    exact matches, every folded token, and every character trigram. A query
+    scores each candidate by the share of its tokens and trigrams found in
+    the candidate's postings; ties keep insertion order. Candidates that do
+    not account for most query tokens (exactly or as a close misspelling)
+    are dropped.
+    """
+
+    def __init__(self):
+        self._exact = {}
+        self._tokens = defaultdict(set)
+        self._trigrams = defaultdict(set)
+        self._order = {}
+        self._key_tokens = defaultdict(set)
+
+    def add(self, key, *texts):
+        self._order.setdefault(key, len(self._order))
+        for text in texts:
+            folded = fold_text(text)
+            if not folded:
+                continue
+            self._exact.setdefault(folded.replace(" ", ""), key)
+            for token in folded.split():
+                self._tokens[token].add(key)
+                self._key_tokens[key].add(token)
+            for gram in trigrams(folded):
+                self._trigrams[gram].add(key)
+
+    def search(self, query, limit=5, min_score=0.3, min_coverage=MIN_COVERAGE):
+        """Return up to ``limit`` ``(key, score)`` pairs, best first; exact names score 1.0."""
+        folded = fold_text(query)
+        if not folded:
+            return []
+        exact = self._exact.get(folded.replace(" ", ""))
+        if exact is not None:
+            return [(exact, 1.0)]
+
+        scores = defaultdict(float)
+        tokens = set(folded.split())
+        for token in tokens:
+            for key in self._tokens.get(token, ()):
+                scores[key] += TOKEN_WEIGHT / len(tokens)
+        grams = trigrams(folded)
+        for gram in grams:
+            for key in self._trigrams.get(gram, ()):
+                scores[key] += TRIGRAM_WEIGHT / len(grams)
+
+        ranked = sorted(
+            # Only exact names reach 1.0; full token/trigram coverage is still a guess
+            ((key, min(round(score, 3), 0.99)) for key, score in scores.items()
+             if score >= min_score and self._coverage(tokens, key) >= min_coverage),
+            key=lambda item: (-item[1], self._order[item[0]]),
+        )
+        return ranked[:limit]
+
+    def _coverage(self, tokens, key):
+        """Share of query ``tokens`` found among ``key``'s tokens, allowing close misspellings."""
+        names = self._key_tokens[key]
+        found = 0
+        for token in tokens:
+            if token in names:
+                found += 1
+                continue
+            grams = trigrams(token)
+            if any(len(grams & trigrams(name)) / len(grams | trigrams(name)) >= TOKEN_SIMILARITY for name in names):
+                found += 1
+        return found / len(tokens)
+
+    def __len__(self):
+        return len(self._order)
@@ -0,0 +1,38 @@
+# coding: utf-8
+"""Regression cases for the calculator sandbox whitelist (calc_sandbox.validate)."""
+
+import pytest
+
+from calc_sandbox import ExpressionError, evaluate
+
+
+@pytest.mark.parametrize("expression", [
+    '[math.format(1) for math in ["{0.__class__.__mro__}"]]',
+    '[random.x for random in [1]]',
+    '{sum: 1 for sum in range(3)}',
+    '[str for x, str in [(1, 2)]]',
+    '[x for _x in [1]]',
+])
+def test_rebinding_protected_names_is_rejected(expression):
+    with pytest.raises(ExpressionError):
+        evaluate(expression)
+
+
+@pytest.mark.parametrize("expression", [
+    'random.seed(1)',
+    'random.setstate(random.getstate())',
+    '[random.seed(x) for x in range(3)]',
+])
+def test_changing_shared_random_state_is_rejected(expression):
+    with pytest.raises(ExpressionError):
+        evaluate(expression)
+
+
+@pytest.mark.parametrize("expression, expected", [
+    ('[x * 2 for x in range(3)]', [0, 2, 4]),
+    ('sum(v for k, v in [(1, 2), (3, 4)])', 6),
+    ('math.sqrt(16)', 4.0),
+    ('0 <= random.random() < 1', True),
+])
+def test_ordinary_expressions_still_work(expression, expected):
+    assert evaluate(expression) == expected